@@ -0,0 +1,5 @@
+#
+# bench - offline benchmarks for spork against a fake launchpad
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
@@ -0,0 +1,122 @@
+#!/bin/bash
+#
+# build-kernel-test - run build-kernel.sh against the stand-in build server
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+# Builds a toy kernel tree through bench/buildserver: a full build, an
+# incremental one, a failing incremental one and a fixed one, checking the
+# exit status, the stamp of the last good build and the collected packages
+# of each. Everything happens in a temporary $HOME.
+#
+
+BENCH=$(dirname $(readlink -f $0))
+BUILD_KERNEL=$BENCH/../build-kernel.sh
+
+TMP=`mktemp -d`
+trap "rm -rf $TMP" EXIT
+export HOME=$TMP/home
+export SSH=$BENCH/buildserver/ssh
+export SCHROOT=$BENCH/buildserver/schroot
+export REMOTE_GIT_REPOS=$TMP/repos
+export GIT_AUTHOR_NAME=spork GIT_AUTHOR_EMAIL=spork@localhost
+export GIT_COMMITTER_NAME=spork GIT_COMMITTER_EMAIL=spork@localhost
+mkdir -p $HOME $REMOTE_GIT_REPOS
+
+FAILED=0
+
+function check() {
+    if eval "$2"; then
+        echo "ok: $1"
+    else
+        echo "FAILED: $1"
+        FAILED=1
+    fi
+}
+
+# A toy kernel tree: building fails if hello.c has an #error in it.
+function create_tree() {
+    git init -q $TMP/src
+    cd $TMP/src
+    mkdir debian debian.master
+    cat > debian.master/changelog <<EOF
+linux (4.4.0-21.37) xenial; urgency=low
+
+  * Toy kernel.
+
+EOF
+    cat > debian/rules <<'EOF'
+#!/bin/bash
+VERSION=$(head -1 debian/changelog | sed -r 's/^[^(]*\(([^)]*)\).*/\1/')
+for target in "$@"; do
+    case $target in
+        clean) cp debian.master/changelog debian/changelog ;;
+        build-*)
+            if grep -q '#error' hello.c; then
+                echo "hello.c: error"
+                exit 1
+            fi
+            mkdir -p debian/stamps
+            touch debian/stamps/stamp-${target}
+            ;;
+        binary-headers) touch ../linux-headers-4.4.0-21_${VERSION}_all.deb ;;
+        binary-*)
+            touch ../linux-image-4.4.0-21-${target#binary-}_${VERSION}_${DEB_HOST_ARCH}.deb
+            ;;
+    esac
+done
+EOF
+    chmod +x debian/rules
+    echo 'int main(void) { return 0; }' > hello.c
+    git add -A && git commit -q -m "Toy kernel"
+
+    git clone -q --bare $TMP/src $REMOTE_GIT_REPOS/ubuntu-xenial.git
+    git clone -q --bare $TMP/src $REMOTE_GIT_REPOS/linux.git
+    git checkout -q -b fix
+}
+
+function build() {
+    # Returns the exit status of build-kernel.sh, output goes to the log.
+    rm -rf $TMP/debs
+    $BUILD_KERNEL -b buildserver -p lp1 -o $TMP/debs "$@" >> $TMP/build.log 2>&1
+}
+
+function built() {
+    cat $HOME/builds/xenial-amd64-generic/ubuntu-xenial/.spork-built 2>/dev/null
+}
+
+create_tree
+
+build
+check "full build" "[ $? -eq 0 ] && ls $TMP/debs/linux-image-*_amd64.deb >/dev/null"
+
+echo 'int main(void) { return 1; }' > hello.c
+git commit -q -a -m "Change"
+build -i
+check "first incremental build is a full one" "[ $? -eq 0 ] && [ \"$(built)\" = $(git rev-parse HEAD) ]"
+good=$(git rev-parse HEAD)
+
+echo 'int main(void) { return 2; }' > hello.c
+git commit -q -a -m "Change again"
+build -i
+check "incremental build" "[ $? -eq 0 ] && grep -q 'BUILD_MODE=incremental' $TMP/build.log"
+check "incremental build packages" "ls $TMP/debs/linux-image-*_amd64.deb >/dev/null"
+good=$(git rev-parse HEAD)
+
+echo '#error broken' > hello.c
+git commit -q -a -m "Break the build"
+build -i
+check "failed incremental build fails" "[ $? -ne 0 ]"
+check "failed build isn't marked as built" "[ \"$(built)\" = $good ]"
+check "failed build collects nothing" "! ls $TMP/debs/*.deb >/dev/null 2>&1"
+
+echo 'int main(void) { return 3; }' > hello.c
+git commit -q -a -m "Fix the build"
+build -i
+check "fixed incremental build" "[ $? -eq 0 ] && [ \"$(built)\" = $(git rev-parse HEAD) ]"
+
+if [ $FAILED -ne 0 ]; then
+    echo "Build log:"
+    cat $TMP/build.log
+fi
+exit $FAILED
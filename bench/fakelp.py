@@ -0,0 +1,225 @@
+#
+# fakelp - a local stand-in for the launchpadlib objects spork uses
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+
+import sys
+import types
+
+# Every method call, collection lookup and lazily loaded attribute that is
+# a round trip with the real launchpadlib goes through world.request(), which
+# counts it and sleeps for the configured latency. Plain attributes of an
+# entry that was already fetched are free, as they are in launchpadlib.
+
+class Entry(object):
+    def __init__(self, world, **attrs):
+        self.world = world
+        self.__dict__.update(attrs)
+
+    def lp_save(self):
+        self.world.request('lp_save')
+
+class Lookup(object):
+    def __init__(self, world, name, get):
+        self.world = world
+        self.name = name
+        self.get = get
+
+    def __getitem__(self, key):
+        self.world.request(self.name)
+        return self.get(key)
+
+def page(world, name, items):
+    items = list(items)
+    world.request(name, len(items))
+    return items
+
+class Root(Entry):
+    def __init__(self, world):
+        Entry.__init__(self, world)
+        world.request('login')
+        self.distributions = Lookup(world, 'distributions',
+                                    lambda name: Distribution(world))
+        self.projects = Lookup(world, 'projects', lambda name: Project(world))
+        self.people = Lookup(world, 'people', lambda name: Team(world))
+        self.bugs = Lookup(world, 'bugs',
+                           lambda bugno: Bug(world, world.by_bugno[int(bugno)]))
+
+    def load(self, url):
+        # Only builds are ever loaded by link.
+        self.world.request('load')
+        tracker = self.world.by_build[int(url.rstrip('/').split('/')[-1])]
+        return Entry(self.world,
+                     build_log_url=self.world.build_log_url(tracker))
+
+    @property
+    def me(self):
+        self.world.request('me')
+        return Entry(self.world, name='arges')
+
+class Distribution(Entry):
+    @property
+    def main_archive(self):
+        self.world.request('main_archive')
+        return PrimaryArchive(self.world)
+
+    def getSeries(self, name_or_version):
+        self.world.request('getSeries')
+        return Series(self.world, name=name_or_version)
+
+class Series(Entry):
+    def getDistroArchSeries(self, archtag):
+        self.world.request('getDistroArchSeries')
+        return Entry(self.world, series=self, architecture_tag=archtag)
+
+    def getPackageUploads(self, **filters):
+        # Signed uploads are always waiting in the queue already.
+        return page(self.world, 'getPackageUploads', [ Upload(self.world) ])
+
+    def __str__(self):
+        return self.name
+
+class Upload(Entry):
+    def acceptFromQueue(self):
+        self.world.request('acceptFromQueue')
+
+class Team(Entry):
+    def getPPAByName(self, name):
+        self.world.request('getPPAByName')
+        return PPA(self.world)
+
+class Project(Entry):
+    def searchTasks(self, **filters):
+        trackers = self.world.trackers
+        return page(self.world, 'searchTasks',
+            [ Entry(self.world, status='In Progress',
+                    bug_link='https://api.launchpad.net/devel/bugs/%d' % t.bugno)
+              for t in trackers ])
+
+class Bug(Entry):
+    def __init__(self, world, tracker):
+        Entry.__init__(self, world, id=tracker.bugno, title=tracker.title,
+                       private=False,
+                       tags=[ tracker.series, 'kernel-release-tracking-bug' ])
+        self.tracker = tracker
+
+    @property
+    def bug_tasks(self):
+        tasks = [ Entry(self.world, bug_target_name='kernel-sru-workflow',
+                        status='In Progress', assignee_link=None) ]
+        for (name, status) in self.tracker.tasks:
+            assignee = None
+            if status == 'In Progress':
+                assignee = 'https://api.launchpad.net/devel/~arges'
+            tasks.append(Entry(self.world,
+                               bug_target_name='kernel-sru-workflow/' + name,
+                               status=status, assignee_link=assignee))
+        return page(self.world, 'bug_tasks', tasks)
+
+    def newMessage(self, subject, content):
+        self.world.request('newMessage')
+
+class SourcePublication(Entry):
+    def binaryFileUrls(self):
+        self.world.request('binaryFileUrls')
+        return [ self.world.binary_url(self.tracker, f)
+                 for f in self.tracker.binary_files() ]
+
+    def sourceFileUrls(self):
+        self.world.request('sourceFileUrls')
+        name = '%s_%s' % (self.source_package_name, self.source_package_version)
+        return [ self.world.url('/librarian/%d/%s.dsc' % (self.tracker.build_id, name)) ]
+
+def match_source(source, source_name=None, version=None, distro_series=None,
+                 status=None, exact_match=False, created_since_date=None,
+                 **filters):
+    if source_name:
+        if exact_match and source.source_package_name != source_name:
+            return False
+        if not exact_match and source_name not in source.source_package_name:
+            return False
+    if version and source.source_package_version != version:
+        return False
+    if distro_series and source.tracker.series != str(distro_series):
+        return False
+    if status and source.status != status:
+        return False
+    if created_since_date and \
+       source.date_created.isoformat() < str(created_since_date):
+        return False
+    return True
+
+class PPA(Entry):
+    # Every package of every tracker, as published.
+    def sources(self):
+        for t in self.world.trackers:
+            for package in t.packages:
+                yield SourcePublication(self.world, tracker=t,
+                    source_package_name=package,
+                    source_package_version=t.package_version(package),
+                    status='Published', date_created=t.created)
+
+    def getPublishedSources(self, **filters):
+        return page(self.world, 'getPublishedSources',
+                    [ s for s in self.sources() if match_source(s, **filters) ])
+
+class PrimaryArchive(PPA):
+    # One linux upload per tracker, whatever its package set.
+    def sources(self):
+        for t in self.world.trackers:
+            yield SourcePublication(self.world, tracker=t,
+                source_package_name='linux', source_package_version=t.version,
+                status='Published', date_created=t.created)
+
+    def getPublishedBinaries(self, binary_name=None, distro_arch_series=None,
+                             version=None, exact_match=False,
+                             created_since_date=None, **filters):
+        binaries = []
+        for t in self.world.trackers:
+            name = 'linux-image-%s-generic' % t.abi
+            if version and t.version != version:
+                continue
+            if binary_name and (name != binary_name if exact_match
+                                else binary_name not in name):
+                continue
+            if distro_arch_series and \
+               t.series != str(distro_arch_series.series):
+                continue
+            if created_since_date and \
+               t.created.isoformat() < str(created_since_date):
+                continue
+            binaries.append(BinaryPublication(self.world, tracker=t,
+                binary_package_name=name, binary_package_version=t.version,
+                build_link='https://api.launchpad.net/devel/ubuntu/+source/'
+                           'linux/%s/+build/%d' % (t.version, t.build_id)))
+        return page(self.world, 'getPublishedBinaries', binaries)
+
+class BinaryPublication(Entry):
+    @property
+    def build(self):
+        self.world.request('build')
+        return Entry(self.world,
+                     build_log_url=self.world.build_log_url(self.tracker))
+
+class Launchpad(object):
+    # Replaces launchpadlib.launchpad.Launchpad; set world before use.
+    world = None
+
+    @classmethod
+    def login_with(cls, *args, **kwargs):
+        return Root(cls.world)
+
+    @classmethod
+    def login_anonymously(cls, *args, **kwargs):
+        return Root(cls.world)
+
+def install():
+    # Make "from launchpadlib.launchpad import Launchpad" find the fake, so
+    # a benchmark can never reach the real service.
+    package = types.ModuleType('launchpadlib')
+    module = types.ModuleType('launchpadlib.launchpad')
+    module.Launchpad = Launchpad
+    package.launchpad = module
+    sys.modules['launchpadlib'] = package
+    sys.modules['launchpadlib.launchpad'] = module
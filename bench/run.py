@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+#
+# run - time spork commands against a local fake launchpad and archive
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+# Usage: python bench/run.py [--bugs 5,50,500] [--latency 0.05] ...
+#
+# Each command runs twice per scale, first with an empty cache directory
+# and then again with what the first run left behind.
+#
+
+import argparse
+import imp
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench import fakelp
+from bench.server import ArchiveServer
+from bench.world import World
+
+COMMANDS = [ 'list', 'promote', 'status', 'query' ]
+
+QUERY_TYPES = [ 'kernel', 'debug', 'gcc_version' ]
+
+# Stand-ins for the external commands spork runs.
+FAKE_COMMANDS = {
+    'copy-proposed-kernel': '#!/bin/sh\nsleep "$SPORK_BENCH_COMMAND_LATENCY"\n',
+    'rmadison': '#!/bin/sh\nsleep "$SPORK_BENCH_COMMAND_LATENCY"\n'
+                'cat "$SPORK_BENCH_RMADISON"\n',
+}
+
+def load_tools():
+    # The fake is installed first, so the tools never see launchpadlib.
+    fakelp.install()
+    review = imp.load_source('kernel_sru_review',
+                             os.path.join(ROOT, 'kernel-sru-review.py'))
+    deburl = imp.load_source('get_linux_deb_url',
+                             os.path.join(ROOT, 'get-linux-deb-url.py'))
+    return (review, deburl)
+
+def review_args(args):
+    return argparse.Namespace(yes=True, verbose=False, profile=False,
+                              trace=None, manual=False, jobs=args.jobs,
+                              no_cache=False, warm=False,
+                              archive_fixture=None)
+
+def bench_list(tools, world, args):
+    tools[0].ReviewSRUKernel(review_args(args)).list_sru_workflow()
+
+def bench_promote(tools, world, args):
+    r = tools[0].ReviewSRUKernel(review_args(args))
+    r.promote_kernel_set([ t.bugno for t in world.trackers ])
+
+def bench_status(tools, world, args):
+    tools[0].ReviewSRUKernel(review_args(args)).status('proposed')
+
+def bench_query(tools, world, args):
+    # Every tracker's version through the batch path, which is what bulk
+    # users of GetPackageLaunchpadURLQuery go through.
+    deburl = tools[1]
+    cache = deburl.PersistentCache('publications', deburl.PUBLICATION_TTLS,
+                                   deburl.PUBLICATION_CACHE_SIZE)
+    toolchain_cache = deburl.PersistentCache('toolchains',
+                                             deburl.TOOLCHAIN_TTLS,
+                                             deburl.TOOLCHAIN_CACHE_SIZE)
+    url_cache = deburl.PersistentCache('urls', deburl.URL_TTLS,
+                                       deburl.URL_CACHE_SIZE)
+    batch = deburl.BatchQuery(args.jobs, cache, False, toolchain_cache,
+                              deburl.URLChecker(args.jobs, url_cache))
+    requests = [ (t.version, t.series, 'amd64', query_type)
+                 for t in world.trackers for query_type in QUERY_TYPES ]
+    errors = [ r for r in batch.run(requests)
+               if 'error' in r or not r.get('result') ]
+    if errors:
+        raise Exception("%d of %d queries failed, e.g. %s" %
+                        (len(errors), len(requests), errors[0]))
+
+def run_command(name, tools, world, args):
+    # Returns (seconds, error); the tools' own output is discarded.
+    world.stats.reset()
+    stdout = sys.stdout
+    error = None
+    start = time.time()
+    try:
+        sys.stdout = open(os.devnull, 'w')
+        globals()['bench_' + name](tools, world, args)
+    except (Exception, SystemExit) as e:
+        error = str(e) or e.__class__.__name__
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return (time.time() - start, error)
+
+def install_commands(path, world):
+    for (name, script) in FAKE_COMMANDS.items():
+        filename = os.path.join(path, name)
+        with open(filename, 'w') as f:
+            f.write(script)
+        os.chmod(filename, stat.S_IRWXU)
+    rmadison = os.path.join(path, 'rmadison.txt')
+    with open(rmadison, 'w') as f:
+        f.write(world.rmadison_output())
+    os.environ['SPORK_BENCH_RMADISON'] = rmadison
+
+def parse():
+    parser = argparse.ArgumentParser(
+        description='Benchmark spork against a local fake launchpad')
+    parser.add_argument('--bugs', default='5,50,500',
+                        help='comma separated numbers of tracking bugs')
+    parser.add_argument('--commands', default=','.join(COMMANDS),
+                        help='comma separated subset of %s' % ','.join(COMMANDS))
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds per launchpad request')
+    parser.add_argument('--http-latency', type=float, default=0.01,
+                        help='seconds per librarian request')
+    parser.add_argument('--command-latency', type=float, default=0.02,
+                        help='seconds each fake external command takes')
+    parser.add_argument('--deb-size', type=int, default=16,
+                        help='size of the kernel image deb in MB')
+    parser.add_argument('--jobs', '-j', type=int, default=4)
+    parser.add_argument('--output', '-o', metavar='FILE',
+                        help='also write the results to FILE')
+    return parser.parse_args()
+
+def main():
+    args = parse()
+    commands = args.commands.split(',')
+    for command in commands:
+        if command not in COMMANDS:
+            print("Unknown command: %s" % command)
+            return 1
+
+    tmp = tempfile.mkdtemp(prefix='spork-bench-')
+    os.environ['PATH'] = tmp + os.pathsep + os.environ['PATH']
+    os.environ['SPORK_BENCH_COMMAND_LATENCY'] = str(args.command_latency)
+    tools = load_tools()
+    package_map = tools[0].ReviewSRUKernel.package_map
+
+    lines = [ "%5s %-8s %-5s %9s %8s %8s %10s  %s" %
+              ("bugs", "command", "cache", "wall", "lp reqs", "http reqs",
+               "http MB", "error") ]
+    print(lines[0])
+    failed = False
+    try:
+        for bugs in [ int(b) for b in args.bugs.split(',') ]:
+            world = World(package_map, bugs, args.latency,
+                          args.http_latency, args.deb_size * 1024 * 1024)
+            fakelp.Launchpad.world = world
+            install_commands(tmp, world)
+            server = ArchiveServer(world).start()
+            try:
+                for command in commands:
+                    cache = os.path.join(tmp, 'cache-%d-%s' % (bugs, command))
+                    os.environ['XDG_CACHE_HOME'] = cache
+                    for label in [ 'cold', 'warm' ]:
+                        (seconds, error) = run_command(command, tools, world,
+                                                       args)
+                        lp = world.stats.total('launchpad')[0]
+                        (http, http_bytes) = world.stats.total('http')
+                        line = "%5d %-8s %-5s %8.2fs %8d %8d %10.1f  %s" % \
+                               (bugs, command, label, seconds, lp, http,
+                                http_bytes / 1048576.0, error or '')
+                        print(line)
+                        sys.stdout.flush()
+                        lines.append(line)
+                        failed = failed or error is not None
+                    shutil.rmtree(cache, ignore_errors=True)
+            finally:
+                server.stop()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,89 @@
+#
+# server - local HTTP server for librarian files and build logs
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+
+import BaseHTTPServer
+import SocketServer
+import socket
+import sys
+import threading
+import time
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Keep-alive, like the librarian, so pooled HEAD checks behave the same.
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def resolve(self):
+        # Returns (kind, payload chunks, size) or None for unknown paths.
+        world = self.server.world
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if len(parts) == 3 and parts[0] == 'builds':
+            log = world.build_log(int(parts[1]))
+            return ('buildlog', [ log ], len(log))
+        if len(parts) == 3 and parts[0] == 'librarian' and \
+           (parts[2].endswith('.deb') or parts[2].endswith('.ddeb')):
+            payload = world.payload(parts[2])
+            return (parts[2].rsplit('.', 1)[1], payload.chunks, payload.size)
+        return None
+
+    def respond(self, body):
+        world = self.server.world
+        if world.http_latency:
+            time.sleep(world.http_latency)
+        found = self.resolve()
+        if not found:
+            world.stats.add('http', self.command + ' missing')
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        (kind, chunks, size) = found
+        self.send_response(200)
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        sent = 0
+        if body:
+            try:
+                for chunk in chunks:
+                    self.wfile.write(chunk)
+                    sent += len(chunk)
+            except socket.error:
+                # Streaming readers hang up once they've found what they
+                # were looking for.
+                self.close_connection = 1
+        world.stats.add('http', '%s %s' % (self.command, kind), sent)
+
+    def do_HEAD(self):
+        self.respond(False)
+
+    def do_GET(self):
+        self.respond(True)
+
+class ArchiveServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, world):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.world = world
+        world.base_url = 'http://127.0.0.1:%d' % self.server_address[1]
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up early are expected, anything else isn't.
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(self, request,
+                                                   client_address)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,276 @@
+#
+# world - synthetic tracking bugs, publications and payloads for benchmarks
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+
+import datetime
+import gzip
+import io
+import os
+import tarfile
+import threading
+import time
+
+# Launchpad returns collections in pages of this many entries.
+PAGE_SIZE = 75
+
+SERIES_KERNELS = {
+    'precise': '3.2.0',
+    'trusty': '3.13.0',
+    'vivid': '3.19.0',
+    'wily': '4.2.0',
+    'xenial': '4.4.0',
+}
+
+ARCHES = [ 'amd64', 'i386' ]
+
+# Package sets published outside main, rmadison labels their suites with
+# the component.
+COMPONENTS = {
+    'linux-raspi2': 'universe',
+    'linux-snapdragon': 'universe',
+}
+
+GCC_VERSION = '5.3.1-14ubuntu2'
+GCC_BANNER = 'gcc version 5.3.1 20160413 (Ubuntu %s) ' % GCC_VERSION
+GCC_COMMENT = 'GCC: (Ubuntu %s) 5.3.1 20160413' % GCC_VERSION
+TOOLCHAIN_LINE = ('Toolchain package versions: binutils_2.26-8ubuntu2 '
+                  'dpkg-dev_1.18.4ubuntu1 g++-5_%s gcc-5_%s '
+                  'libc6-dev_2.23-0ubuntu3 linux-libc-dev_4.4.0-21.37' %
+                  (GCC_VERSION, GCC_VERSION))
+
+# Workflow tasks of a tracking bug, as (name, status) by bug index mod 3.
+WORKFLOW_TASKS = [
+    ('automated-testing', [ 'Fix Released', 'Fix Released', 'Fix Released' ]),
+    ('certification-testing', [ 'New', 'Confirmed', 'Fix Released' ]),
+    ('prepare-package', [ 'Fix Released', 'Fix Released', 'Fix Released' ]),
+    ('prepare-package-meta', [ 'Fix Released', 'Fix Released', 'Fix Released' ]),
+    ('prepare-package-signed', [ 'Fix Released', 'Fix Released', 'Fix Released' ]),
+    ('promote-to-proposed', [ 'Confirmed', 'In Progress', 'Fix Released' ]),
+    ('promote-to-security', [ 'New', 'New', 'Confirmed' ]),
+    ('promote-to-updates', [ 'New', 'New', 'Confirmed' ]),
+    ('regression-testing', [ 'New', 'Confirmed', 'Fix Released' ]),
+    ('security-signoff', [ 'Invalid', 'Fix Released', 'Fix Released' ]),
+    ('upload-to-ppa', [ 'Fix Released', 'Fix Released', 'Fix Released' ]),
+    ('verification-testing', [ 'New', 'In Progress', 'Fix Released' ]),
+]
+
+class Stats:
+    # Requests and bytes by (kind, name), shared by the fake launchpad and
+    # the archive server.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, kind, name, size=0):
+        with self.lock:
+            count = self.counts.setdefault((kind, name), [0, 0])
+            count[0] += 1
+            count[1] += size
+
+    def total(self, kind):
+        with self.lock:
+            counts = [ c for (k, c) in self.counts.items() if k[0] == kind ]
+        return (sum([ c[0] for c in counts ]), sum([ c[1] for c in counts ]))
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+
+class Tracker:
+    def __init__(self, index, series, packageset, packages, created):
+        kernel = SERIES_KERNELS.get(series, '4.4.0')
+        self.index = index
+        self.bugno = 1500000 + index
+        self.series = series
+        self.packageset = packageset
+        self.packages = packages
+        self.abi = '%s-%d' % (kernel, 100 + index)
+        self.version = '%s.%d' % (self.abi, 200 + index)
+        self.meta_version = '%s.%d.%d' % (kernel, 100 + index, 200 + index)
+        self.build_id = 9000000 + index
+        self.created = created
+        self.title = '%s: %s -proposed tracker' % (packageset, self.version)
+        self.tasks = [ (name, statuses[index % 3])
+                       for (name, statuses) in WORKFLOW_TASKS ]
+
+    def package_version(self, package):
+        if '-meta' in package:
+            return self.meta_version
+        return self.version
+
+    def binary_files(self):
+        files = []
+        for arch in ARCHES:
+            for name in [ 'linux-image-%s-generic', 'linux-image-extra-%s-generic',
+                          'linux-headers-%s-generic', 'linux-tools-%s',
+                          'linux-cloud-tools-%s' ]:
+                files.append('%s_%s_%s.deb' % (name % self.abi, self.version, arch))
+            files.append('linux-image-%s-generic-dbgsym_%s_%s.ddeb' %
+                         (self.abi, self.version, arch))
+        for name in [ 'linux-headers-%s' % self.abi, 'linux-doc',
+                      'linux-source-%s' % self.abi.split('-')[0] ]:
+            files.append('%s_%s_all.deb' % (name, self.version))
+        return files
+
+class Payload:
+    # A file served as a list of chunks; padding chunks all refer to one
+    # shared block so big payloads cost no memory.
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.size = sum([ len(c) for c in chunks ])
+
+def padding(size, block):
+    chunks = [ block ] * (size // len(block))
+    if size % len(block):
+        chunks.append(block[:size % len(block)])
+    return chunks
+
+def ar_header(name, size):
+    return '%-16s%-12d%-6d%-6d%-8s%-10d`\n' % (name, 0, 0, 0, '100644', size)
+
+def tar_chunks(member, chunks):
+    info = tarfile.TarInfo(member)
+    info.size = sum([ len(c) for c in chunks ])
+    info.mode = 0644
+    tail = '\0' * ((512 - info.size % 512) % 512) + '\0' * 1024
+    return [ info.tobuf() ] + chunks + [ tail ]
+
+def small_tar_gz(member, content):
+    f = io.BytesIO()
+    tar = tarfile.open(fileobj=f, mode='w:gz')
+    info = tarfile.TarInfo(member)
+    info.size = len(content)
+    tar.addfile(info, io.BytesIO(content))
+    tar.close()
+    return f.getvalue()
+
+def deb_payload(member, marker, size, block):
+    # An uncompressed data.tar holding member, with marker half way in, so
+    # streaming readers download about half of it. Compressing it per
+    # request would make the server the bottleneck.
+    half = size // 2
+    content = padding(half, block) + [ marker ] + \
+              padding(max(0, size - half - len(marker)), block)
+    data = tar_chunks(member, content)
+    control = small_tar_gz('./control', 'Package: bench\n')
+    chunks = [ '!<arch>\n', ar_header('debian-binary', 4), '2.0\n',
+               ar_header('control.tar.gz', len(control)), control ]
+    if len(control) % 2:
+        chunks.append('\n')
+    data_size = sum([ len(c) for c in data ])
+    chunks.append(ar_header('data.tar', data_size))
+    chunks.extend(data)
+    if data_size % 2:
+        chunks.append('\n')
+    return Payload(chunks)
+
+def gzip_text(text):
+    f = io.BytesIO()
+    g = gzip.GzipFile(fileobj=f, mode='wb')
+    g.write(text)
+    g.close()
+    return f.getvalue()
+
+class World:
+    # Everything the fake launchpad and archive server hand out, for a
+    # number of tracking bugs spread over the series and package sets of
+    # package_map.
+
+    def __init__(self, package_map, bugs, latency=0.05, http_latency=0.01,
+                 deb_size=16 * 1024 * 1024, log_size=4 * 1024 * 1024):
+        self.latency = latency
+        self.http_latency = http_latency
+        self.deb_size = deb_size
+        self.stats = Stats()
+        self.base_url = None
+        self.block = os.urandom(1024 * 1024)
+
+        sets = []
+        for series in sorted(package_map):
+            for packageset in sorted(package_map[series]):
+                sets.append((series, packageset, package_map[series][packageset]))
+
+        now = datetime.datetime.utcnow()
+        self.trackers = []
+        for i in range(bugs):
+            (series, packageset, packages) = sets[i % len(sets)]
+            created = now - datetime.timedelta(hours=bugs - i)
+            self.trackers.append(Tracker(i, series, packageset, packages,
+                                         created))
+        self.by_bugno = dict([ (t.bugno, t) for t in self.trackers ])
+        self.by_build = dict([ (t.build_id, t) for t in self.trackers ])
+
+        # Every fourth build log lacks the toolchain line, so the gcc
+        # lookup falls back to streaming the kernel deb.
+        filler = ''.join([ 'CC      drivers/bench/file%06d.o\n' % i
+                           for i in range(log_size // 32) ])
+        header = 'Building linux on amd64\n'
+        self.build_logs = {
+            True: gzip_text(header + TOOLCHAIN_LINE + '\n' + filler),
+            False: gzip_text(header + filler),
+        }
+
+        self.package_map = package_map
+
+    def request(self, name, items=0):
+        # One launchpad round trip per page of results.
+        pages = max(1, (items + PAGE_SIZE - 1) // PAGE_SIZE)
+        for i in range(pages):
+            self.stats.add('launchpad', name)
+            if self.latency:
+                time.sleep(self.latency)
+
+    def url(self, path):
+        return self.base_url + path
+
+    def binary_url(self, tracker, filename):
+        return self.url('/librarian/%d/%s' % (tracker.build_id, filename))
+
+    def build_log_url(self, tracker):
+        return self.url('/builds/%d/buildlog.txt.gz' % tracker.build_id)
+
+    def build_log(self, build_id):
+        return self.build_logs[build_id % 4 != 0]
+
+    def payload(self, filename):
+        # .deb and .ddeb contents, with the gcc banner where the toolchain
+        # lookup looks for it.
+        package = filename.split('_')[0]
+        size = self.deb_size
+        if package.startswith('linux-image-extra-'):
+            return deb_payload('./lib/modules/extra', '', size * 5 // 2,
+                               self.block)
+        elif package.startswith('linux-image-') and package.endswith('-dbgsym'):
+            abi = package[len('linux-image-'):-len('-generic-dbgsym')]
+            return deb_payload('./usr/lib/debug/boot/vmlinux-%s-generic' % abi,
+                               GCC_COMMENT, size * 25, self.block)
+        elif package.startswith('linux-image-'):
+            abi = package[len('linux-image-'):-len('-generic')]
+            return deb_payload('./boot/vmlinuz-%s-generic' % abi, GCC_BANNER,
+                               size, self.block)
+        return deb_payload('./usr/share/doc/%s/changelog.gz' % package, '',
+                           size // 2, self.block)
+
+    def rmadison_output(self):
+        # What rmadison would say about every package in package_map.
+        latest = {}
+        for t in self.trackers:
+            latest[(t.series, t.packageset)] = t
+        lines = []
+        for series in sorted(self.package_map):
+            for packageset in sorted(self.package_map[series]):
+                t = latest.get((series, packageset))
+                component = COMPONENTS.get(packageset)
+                for package in self.package_map[series][packageset]:
+                    for pocket in [ 'updates', 'proposed' ]:
+                        version = t.package_version(package) if t else '0'
+                        suite = '%s-%s' % (series, pocket)
+                        if component:
+                            suite += '/' + component
+                        lines.append(' %s | %s | %s | source' %
+                                     (package, version, suite))
+        return '\n'.join(lines) + '\n'
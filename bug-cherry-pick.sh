@@ -2,7 +2,9 @@
 
 # usage
 if [ $# -lt 3 ]; then
-  echo "$0 BUG# SERIES COMMITS..."
+  echo "$0 BUG# SERIES[,SERIES...] COMMITS..."
+  echo "  With several series each one gets its own worktree under"
+  echo "  \$KERNEL_SRC/lpBUG#, and patches are written to \$KERNEL_SRC/lpBUG#/patches."
   exit
 fi
 
@@ -10,10 +12,115 @@ BUG=$1 && shift
 SERIES=$1 && shift
 COMMITS=$@
 
+KERNEL_SRC=${KERNEL_SRC:-~/src/kernel}
+BUGLINK="BugLink: http://bugs.launchpad.net/bugs/${BUG}"
+
 echo $BUG $SERIES
 echo $COMMITS
 
-cd ~/src/kernel/ubuntu-${SERIES}
+# Prefix every line of a series' output with its name.
+function prefix() {
+  sed -u "s/^/[$1] /"
+}
+
+# Adds the BugLink after the subject of the last commit.
+function add_buglink() {
+  git log -1 --format=%B | awk -v link="$BUGLINK" '{print} NR==1 {print ""; print link}' |
+    git commit -q --amend -F -
+}
+
+function fetch_series() {
+  local series=$1
+  git -C $KERNEL_SRC/ubuntu-$series fetch -q origin 2>&1 | prefix $series
+  if [ ${PIPESTATUS[0]} -ne 0 ]; then
+    echo "fetch-failed 0" > $STATUS/$series
+  fi
+}
+
+function pick_series() {
+  local series=$1
+  local tree=$WORKTREES/ubuntu-$series
+  local picked=0
+
+  if [ -e $tree ]; then
+    echo "exists 0 $tree" > $STATUS/$series
+    return
+  fi
+  # Never reset an lpBUG# branch someone already has work on.
+  if git -C $KERNEL_SRC/ubuntu-$series rev-parse -q --verify refs/heads/lp${BUG} >/dev/null; then
+    echo "branch-exists 0 lp${BUG} in $KERNEL_SRC/ubuntu-$series" > $STATUS/$series
+    return
+  fi
+  if ! git -C $KERNEL_SRC/ubuntu-$series worktree add -q -b lp${BUG} $tree origin/master; then
+    echo "worktree-failed 0" > $STATUS/$series
+    return
+  fi
+
+  cd $tree
+  for commit in $COMMITS; do
+    # Runs in the background, so no -e; add_buglink amends the message.
+    if ! git cherry-pick -sx $commit; then
+      # Left as is, for resolving in the worktree.
+      echo "conflict $picked $commit: $(git diff --name-only --diff-filter=U | tr '\n' ' ')" > $STATUS/$series
+      return
+    fi
+    add_buglink
+    picked=$((picked + 1))
+  done
+  echo "ok $picked" > $STATUS/$series
+}
+
+function summary() {
+  local total=$(echo $COMMITS | wc -w)
+  printf "\n%-10s %-14s %-8s %-8s %s\n" SERIES RESULT PICKED PATCHES DETAILS
+  for series in ${SERIES//,/ }; do
+    result="failed" picked=0 details=""
+    [ -e $STATUS/$series ] && read result picked details < $STATUS/$series
+    patches="-"
+    if [ "$result" = ok ]; then
+      patches=$(ls $PATCHES/$series | wc -l)
+      details=$WORKTREES/ubuntu-$series
+    fi
+    printf "%-10s %-14s %-8s %-8s %s\n" $series $result "$picked/$total" $patches "$details"
+  done
+}
+
+if [[ $SERIES == *,* ]]; then
+  WORKTREES=$KERNEL_SRC/lp${BUG}
+  PATCHES=$WORKTREES/patches
+  STATUS=`mktemp -d`
+  trap "rm -rf $STATUS" EXIT
+  mkdir -p $WORKTREES
+
+  # fetch every tree at once
+  for series in ${SERIES//,/ }; do
+    fetch_series $series &
+  done
+  wait
+
+  # cherry-pick into a fresh worktree per series, concurrently
+  for series in ${SERIES//,/ }; do
+    if [ ! -e $STATUS/$series ]; then
+      (pick_series $series 2>&1 | prefix $series) &
+    fi
+  done
+  wait
+
+  # extract patches of every series that applied cleanly
+  for series in ${SERIES//,/ }; do
+    result="failed"
+    [ -e $STATUS/$series ] && read result rest < $STATUS/$series
+    if [ "$result" = ok ]; then
+      git -C $WORKTREES/ubuntu-$series format-patch -q -o $PATCHES/$series \
+        --subject-prefix="SRU][${series^^}][PATCH" origin/master..lp${BUG}
+    fi
+  done
+
+  summary
+  exit
+fi
+
+cd $KERNEL_SRC/ubuntu-${SERIES}
 git checkout master
 git pull --rebase
 git checkout -b lp${BUG}
@@ -26,5 +133,3 @@ done
 # add BugLinks, subject SRU, desc
 
 # do a test build
-
-
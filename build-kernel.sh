@@ -11,24 +11,45 @@ ARCH="amd64"
 FLAVOR="generic"
 DDEB=""
 PREFIX="test"
+INCREMENTAL=""
+PUSH_ONLY=""
+JOB_TREE=""
+OUTPUT_DIR=""
 #BUILDSERVER="" # Edit this to add default value.
-REMOTE_GIT_REPOS=/usr3/ubuntu
+REMOTE_GIT_REPOS=${REMOTE_GIT_REPOS:-/usr3/ubuntu}
+REMOTE_BUILD_TREES=${REMOTE_BUILD_TREES:-~/builds}
+
+# SSH and SCHROOT can be set to local stand-ins for testing, see
+# bench/buildserver.
+if [[ -n $SSH ]]; then
+    export GIT_SSH_COMMAND=$SSH
+fi
+SSH=${SSH:-ssh}
+SCHROOT=${SCHROOT:-schroot}
 
 # parse arguments
-while getopts "a:f:p:b:dvh" opt; do
+while getopts "a:f:p:b:o:diPWvh" opt; do
     case $opt in
         a) ARCH=$OPTARG ;;
         f) FLAVOR=$OPTARG ;;
         d) DDEB="skipdbg=false" ;;
+        i) INCREMENTAL=1 ;;
+        P) PUSH_ONLY=1 ;;
+        W) JOB_TREE=1 ;;
+        o) OUTPUT_DIR=$OPTARG ;;
         b) BUILDSERVER=$OPTARG ;;
         p) PREFIX=$OPTARG ;;
         h|*)
-            echo "usage: $0 -a <arch> b <buildserver> -f <flavor> -p <prefix> -d"
+            echo "usage: $0 -a <arch> b <buildserver> -f <flavor> -p <prefix> -o <dir> -d -i -P -W"
             echo "	a - arch - one of amd64,i386,armhf DEFAULT: amd64"
             echo "	b - buildserver - buildd server with schroots"
             echo "	f - flavor - generic,virtual, server for appropriate series DEFAULT: generic"
             echo "	p - prefix - appended to version (ex: lpXXXXXX) DEFAULT: test"
             echo "	d - build with ddebs DEFAULT: off"
+            echo "	i - incremental build in a persistent tree with ccache DEFAULT: off"
+            echo "	o - output - copy the built packages into this directory DEFAULT: off"
+            echo "	P - only push the branch to the buildserver DEFAULT: off"
+            echo "	W - build an already pushed branch in a tree of its own DEFAULT: off"
             exit 0
             ;;
     esac
@@ -39,6 +60,11 @@ function dump_vars() {
     echo FLAVOR=$FLAVOR
     echo SERIES=$SERIES
     echo DDEB=$DDEB
+    echo INCREMENTAL=$INCREMENTAL
+    echo BUILD_MODE=$BUILD_MODE
+    echo PUSH_ONLY=$PUSH_ONLY
+    echo JOB_TREE=$JOB_TREE
+    echo OUTPUT_DIR=$OUTPUT_DIR
     echo BUILDSERVER=$BUILDSERVER
     echo LOCAL_BRANCH=$LOCAL_BRANCH
     echo REMOTE_BRANCH=$REMOTE_BRANCH
@@ -46,6 +72,7 @@ function dump_vars() {
     echo ORIG_VERSION=$ORIG_VERSION
     echo VERSION=$VERSION
     echo REMOTE_SRC_PATH=$REMOTE_SRC_PATH
+    echo REMOTE_REPO_PATH=$REMOTE_REPO_PATH
     echo REMOTE_DEST_PATH=$REMOTE_DEST_PATH
     echo ""
 }
@@ -58,13 +85,45 @@ function get_vars() {
     fi
     LOCAL_BRANCH=`git rev-parse --abbrev-ref HEAD`
     REMOTE_BRANCH=$PREFIX
-    TIMESTAMP=$(date +"%Y%m%d%H%M")
+    TIMESTAMP=${TIMESTAMP:-$(date +"%Y%m%d%H%M")}
     changelog_info=`head -1 debian.master/changelog`
     ORIG_VERSION=`echo $changelog_info | awk '{print $2}' | sed -r -e 's/^\(//;s/\)$//'`
     VERSION=${ORIG_VERSION}~${PREFIX}v${TIMESTAMP}
     SERIES=`echo $changelog_info | awk '{print $3}' | sed 's/;//' | sed 's/\-proposed//'`
     REMOTE_SRC_PATH=${REMOTE_GIT_REPOS}/ubuntu-$SERIES.git
     REMOTE_DEST_PATH=~/$PREFIX/ubuntu-$SERIES
+    if [[ -n $INCREMENTAL ]]; then
+        # One tree per series/arch/flavor, kept between builds.
+        REMOTE_DEST_PATH=$REMOTE_BUILD_TREES/$SERIES-$ARCH-$FLAVOR/ubuntu-$SERIES
+    elif [[ -n $JOB_TREE ]]; then
+        REMOTE_DEST_PATH=~/$PREFIX/$SERIES-$ARCH-$FLAVOR/ubuntu-$SERIES
+    fi
+    # Where the branch is pushed to, shared by all job trees.
+    REMOTE_REPO_PATH=$REMOTE_DEST_PATH
+    if [[ -n $PUSH_ONLY || -n $JOB_TREE ]]; then
+        REMOTE_REPO_PATH=~/$PREFIX/ubuntu-$SERIES
+    fi
+}
+
+# An incremental build reuses the tree (changelog, build directory and
+# stamps) of the last build for this series/arch/flavor, unless the
+# packaging changed since then.
+function get_build_mode() {
+    BUILD_MODE="full"
+    if [[ -z $INCREMENTAL ]]; then
+        return
+    fi
+    LAST_COMMIT=`$SSH $BUILDSERVER "cat $REMOTE_DEST_PATH/.spork-built 2>/dev/null"`
+    if [[ -n $LAST_COMMIT ]] && git cat-file -e "$LAST_COMMIT^{commit}" 2>/dev/null &&
+       git diff --quiet $LAST_COMMIT $LOCAL_BRANCH -- 'debian*'; then
+        # The changelog isn't regenerated, so packages keep its version.
+        LAST_VERSION=`$SSH $BUILDSERVER "head -1 $REMOTE_DEST_PATH/debian/changelog 2>/dev/null" |
+            sed -r -e 's/^[^(]*\(([^)]*)\).*/\1/'`
+        if [[ -n $LAST_VERSION ]]; then
+            BUILD_MODE="incremental"
+            VERSION=$LAST_VERSION
+        fi
+    fi
 }
 
 function sanity_check() {
@@ -78,7 +137,7 @@ function sanity_check() {
 function execute_remote() {
     echo $2
     echo "$BUILDSERVER: $1"
-    ssh $BUILDSERVER $1
+    $SSH $BUILDSERVER $1
 }
 
 function execute_local() {
@@ -90,52 +149,130 @@ function execute_local() {
 function remote_create() {
     cmd="
     cd ~;
-    mkdir -p ~/$PREFIX;
-    if [ ! -d $REMOTE_DEST_PATH ]; then
-        git clone --reference ${REMOTE_GIT_REPOS}/linux.git $REMOTE_SRC_PATH $REMOTE_DEST_PATH;
-        cd $REMOTE_DEST_PATH;
-        git config add receive.denyCurrentBranch ignore;
+    mkdir -p ${REMOTE_REPO_PATH%/*};
+    if [ ! -d $REMOTE_REPO_PATH ]; then
+        git clone --reference ${REMOTE_GIT_REPOS}/linux.git $REMOTE_SRC_PATH $REMOTE_REPO_PATH;
+        cd $REMOTE_REPO_PATH;
+        git config receive.denyCurrentBranch ignore;
     else
-        cd $REMOTE_DEST_PATH;
+        cd $REMOTE_REPO_PATH;
         git fetch;
     fi
     "
     execute_remote "$cmd" "[updating remote repository]"
 
     cmd="
-    git push -f $BUILDSERVER:$REMOTE_DEST_PATH $LOCAL_BRANCH:$REMOTE_BRANCH
+    git push -f $BUILDSERVER:$REMOTE_REPO_PATH $LOCAL_BRANCH:$REMOTE_BRANCH
     "
     execute_local "$cmd" "[pushing changes]"
+}
 
-    cmd="
+function remote_checkout() {
+    checkout="
     cd $REMOTE_DEST_PATH;
-    git checkout -f $REMOTE_BRANCH;
+    git checkout -f $REMOTE_BRANCH;"
+    if [[ -n $JOB_TREE ]]; then
+        # A clone sharing the pushed repository's objects, so concurrent
+        # builds of one branch don't share a checkout or build.log.
+        checkout="
+        mkdir -p ${REMOTE_DEST_PATH%/*};
+        [ -d $REMOTE_DEST_PATH ] || git clone -q --shared $REMOTE_REPO_PATH $REMOTE_DEST_PATH;
+        cd $REMOTE_DEST_PATH;
+        git fetch -q $REMOTE_REPO_PATH +refs/heads/$REMOTE_BRANCH:refs/spork/$REMOTE_BRANCH \
+            +refs/remotes/origin/master:refs/remotes/origin/master;
+        git checkout -q -f refs/spork/$REMOTE_BRANCH;"
+    fi
+
+    if [[ $BUILD_MODE == "incremental" ]]; then
+        # Only changed files get new mtimes, so make rebuilds just those.
+        cmd="
+        $checkout
+        git reset --hard HEAD;
+        "
+        execute_remote "$cmd" "[updating sources, keeping changelog of $LAST_COMMIT]"
+        return
+    fi
+
+    cmd="
+    set -o pipefail;
+    $checkout
     git reset --hard HEAD; git clean -xfd;
     rm -f debian/changelog;
     echo 'dch -b -v $VERSION -D $SERIES -c debian.master/changelog 'Test build for $PREFIX.''
-        | tee --append build.log | schroot -c $SERIES-$ARCH;
+        | tee --append build.log | $SCHROOT -c $SERIES-$ARCH;
     "
     execute_remote "$cmd" "[generating changelog]"
 }
 
 function remote_build() {
+    if [[ $BUILD_MODE == "incremental" ]]; then
+        # Keep the build directory, just make the build step run again.
+        prepare="rm -f debian/stamps/stamp-build-${FLAVOR};"
+        clean=""
+    else
+        prepare="git clean -xfd;"
+        clean="skipabi=true skipmodule=true fakeroot debian/rules clean;"
+    fi
+    ccache=""
+    if [[ -n $INCREMENTAL ]]; then
+        ccache="[ -d /usr/lib/ccache ] || echo \"ccache not installed in schroot\";
+          export PATH=/usr/lib/ccache:\$PATH CCACHE_DIR=\$HOME/.ccache/${SERIES}-${ARCH};"
+    fi
+
+    # Packages of an earlier build of this version go first, so a failed
+    # build can't leave them behind to be collected. Only a successful
+    # build marks HEAD as built.
     cmd="
+    set -o pipefail;
     cd $REMOTE_DEST_PATH;
-    git clean -xfd;
-    echo 'skipabi=true skipmodule=true fakeroot debian/rules clean;
+    $prepare
+    rm -f ../*_${VERSION}_*deb;
+    echo 'set -e;
+          $ccache
+          $clean
           skipabi=true skipmodule=true debian/rules build-${FLAVOR};
           skipabi=true skipmodule=true fakeroot debian/rules binary-${FLAVOR} binary-headers ${DDEB}; 2>&1'
-        | tee --append build.log | schroot -c ${SERIES}-${ARCH};
+        | tee --append build.log | $SCHROOT -c ${SERIES}-${ARCH};
+    status=\$?;
+    if [ \$status -eq 0 ]; then
+        git rev-parse HEAD > .spork-built;
+    fi;
     rm -f ../*.patch;
     git format-patch -o .. origin/master;
+    exit \$status;
     "
     execute_remote "$cmd" "[building kernel]"
 }
 
+function collect_debs() {
+    mkdir -p $OUTPUT_DIR
+    echo "[collecting packages]"
+    files=`$SSH $BUILDSERVER "cd ${REMOTE_DEST_PATH%/*} && tar -cf - *_${VERSION}_*deb" |
+        tar -C $OUTPUT_DIR -xvf -`
+    if [[ -z $files ]]; then
+        echo "No packages of $VERSION found."
+        exit 1
+    fi
+    echo "$files"
+}
+
 # main
 get_vars
 sanity_check
+get_build_mode
 dump_vars
-remote_create
-remote_build
+if [[ -z $JOB_TREE ]]; then
+    remote_create || exit 1
+fi
+if [[ -n $PUSH_ONLY ]]; then
+    exit 0
+fi
+remote_checkout || exit 1
+if [[ -n $OUTPUT_DIR ]]; then
+    rm -f $OUTPUT_DIR/*_${VERSION}_*deb
+fi
+remote_build || { echo "Build failed."; exit 1; }
+if [[ -n $OUTPUT_DIR ]]; then
+    collect_debs
+fi
 
@@ -0,0 +1,147 @@
+#!/usr/bin/python
+#
+# build-matrix - build test kernels for several arches and flavors at once
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+# Runs build-kernel.sh for every arch x flavor, spread over one or more
+# build servers. The branch is pushed once per server, then every build
+# gets a tree of its own there. Set SSH (and SCHROOT) to local stand-ins to
+# try it without a build server.
+#
+
+import Queue
+import argparse
+import glob
+import os
+import threading
+import time
+
+from spork.jobs import BatchItem, Job, StepFailed, format_summary, log
+
+BUILD_KERNEL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'build-kernel.sh')
+
+class Build(BatchItem):
+    def __init__(self, arch, flavor):
+        BatchItem.__init__(self, (arch, flavor), "%s/%s" % (arch, flavor))
+        self.arch = arch
+        self.flavor = flavor
+        self.server = None
+        self.debs = []
+
+def build_kernel_cmd(args, server, *options):
+    cmd = [ BUILD_KERNEL, '-b', server, '-p', args.prefix ] + list(options)
+    if args.ddeb:
+        cmd.append('-d')
+    if args.incremental:
+        cmd.append('-i')
+    return cmd
+
+def run_job(job):
+    job.run()
+    if not job.ok:
+        raise Exception(job.error or "exit %d" % job.returncode)
+
+def push(args, servers):
+    # Returns the servers the branch made it to.
+    pushed = []
+    threads = []
+    for server in servers:
+        job = Job(build_kernel_cmd(args, server, '-P'), "push %s" % server)
+        thread = threading.Thread(target=job.run)
+        thread.start()
+        threads.append((server, job, thread))
+    for (server, job, thread) in threads:
+        thread.join()
+        if job.ok:
+            pushed.append(server)
+        else:
+            log("push failed, not building on %s" % server)
+    return pushed
+
+def run_build(args, build, server):
+    build.server = server
+    output = os.path.join(args.output, "%s-%s" % (build.arch, build.flavor))
+    cmd = build_kernel_cmd(args, server, '-W', '-a', build.arch,
+                           '-f', build.flavor, '-o', output)
+    label = "%s %s" % (server, build.label)
+    try:
+        build.step("build", run_job, Job(cmd, label))
+    except StepFailed:
+        pass
+    build.debs = sorted(glob.glob(os.path.join(output, '*deb')))
+
+def run_matrix(args, builds, servers):
+    # Each server runs up to args.slots builds, taking the next one from the
+    # shared queue whenever a slot frees up, so faster servers do more.
+    queue = Queue.Queue()
+    for b in builds:
+        queue.put(b)
+
+    def worker(server):
+        while True:
+            try:
+                b = queue.get_nowait()
+            except Queue.Empty:
+                return
+            run_build(args, b, server)
+
+    threads = []
+    for server in servers:
+        for i in range(max(1, args.slots)):
+            thread = threading.Thread(target=worker, args=(server,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+    # Join with a timeout so ^C still gets through.
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(1)
+
+def parse():
+    parser = argparse.ArgumentParser(
+        description='Build test kernels for several arches and flavors')
+    parser.add_argument('--arch', '-a', default='amd64',
+                        help='comma separated arches DEFAULT: amd64')
+    parser.add_argument('--flavor', '-f', default='generic',
+                        help='comma separated flavors DEFAULT: generic')
+    parser.add_argument('--buildserver', '-b', required=True,
+                        help='comma separated build servers')
+    parser.add_argument('--slots', '-s', type=int, default=2,
+                        help='concurrent builds per build server DEFAULT: 2')
+    parser.add_argument('--prefix', '-p', default='test',
+                        help='appended to version (ex: lpXXXXXX) DEFAULT: test')
+    parser.add_argument('--output', '-o', default='debs',
+                        help='where packages are collected, one directory '
+                             'per arch/flavor DEFAULT: debs')
+    parser.add_argument('--ddeb', '-d', action='store_true',
+                        help='build with ddebs')
+    parser.add_argument('--incremental', '-i', action='store_true',
+                        help='incremental builds, see build-kernel.sh -i')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse()
+    start = time.time()
+
+    # Every job must end up with the same version.
+    os.environ['TIMESTAMP'] = time.strftime("%Y%m%d%H%M")
+
+    servers = args.buildserver.split(',')
+    builds = [ Build(arch, flavor) for arch in args.arch.split(',')
+               for flavor in args.flavor.split(',') ]
+
+    servers = push(args, servers)
+    if not servers:
+        print("Couldn't push to any build server")
+        exit(1)
+    run_matrix(args, builds, servers)
+
+    print("")
+    for (b, line) in zip(builds, format_summary(builds)):
+        print("%s  %s  %d packages" % (line, b.server, len(b.debs)))
+    failed = [ b for b in builds if not b.ok ]
+    print("%d builds, %d failed, %.1fs" % (len(builds), len(failed),
+                                          time.time() - start))
+    exit(1 if failed else 0)
@@ -5,105 +5,267 @@
 # Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
 #
 
+import argparse
+import copy
+import csv
+import datetime
+import json
+import re
 import sys
-import subprocess
-import urllib2
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 from launchpadlib.launchpad import Launchpad
-
-class GetPackageLaunchpadURLQuery:
+from spork.buildlog import find_log_line
+from spork.cache import PersistentCache
+from spork.debstream import DebStreamError, scan_deb_member
+from spork.fetch import Fetcher
+from spork import instrument
+from spork.urlcheck import URLChecker, URL_TTLS, URL_CACHE_SIZE
+
+# How long cached publishing lookups stay valid, by publication status.
+# Binary URLs of an exact version don't change, but a Pending upload may
+# still gain binaries and a Published one may get more architectures built.
+PUBLICATION_TTLS = {
+    'Pending': 10 * 60,
+    'Published': 24 * 60 * 60,
+    'Superseded': 30 * 24 * 60 * 60,
+    'Deleted': 30 * 24 * 60 * 60,
+    'Obsolete': 30 * 24 * 60 * 60,
+}
+PUBLICATION_CACHE_SIZE = 5000
+
+# A build's toolchain never changes, so these are kept forever.
+TOOLCHAIN_TTLS = { 'Built': None }
+TOOLCHAIN_CACHE_SIZE = 20000
+
+# "gcc version 5.3.1 20160413 (Ubuntu 5.3.1-14ubuntu2)" in the vmlinuz and
+# "GCC: (Ubuntu 5.3.1-14ubuntu2) 5.3.1 20160413" in the vmlinux .comment.
+GCC_BANNER = re.compile(r'gcc version \S+[^(\n]*\(\S+ ([^)\s]+)\)')
+GCC_COMMENT = re.compile(r'GCC: \(\S+ ([^)\s]+)\)')
+
+# Report rows are per upload and arch, and never go stale.
+REPORT_TTLS = { 'Report': None }
+REPORT_FIELDS = [ 'series', 'arch', 'version', 'build', 'gcc', 'source',
+                  'error' ]
+
+# Seconds between saves of the report's progress.
+REPORT_SAVE_INTERVAL = 30
+
+QUERY_TYPES = {
+    'debug': 'get_kernel_debug_package',
+    'kernel': 'get_kernel_packages',
+    'gcc': 'get_gcc_package',
+    'gcc_version': 'get_gcc_version',
+}
+
+# Query types whose result is a space separated list of URLs.
+URL_QUERY_TYPES = [ 'debug', 'kernel', 'gcc' ]
+
+class PackageNotFound(Exception):
+    pass
+
+class GetPackageLaunchpadURLQuery(object):
     build = None
 
-    def __init__(self, arch, version, series):
-        launchpad = Launchpad.login_anonymously('spork', 'production')
-        ubuntu = launchpad.distributions["ubuntu"]
+    def __init__(self, arch, version, series, cache=None, refresh=False,
+                 launchpad=None, toolchain_cache=None, url_checker=None,
+                 objects=None):
+        self.cache = cache
+        self.toolchain_cache = toolchain_cache
+        self.refresh = refresh
+        self.url_checker = url_checker or URLChecker()
+
+        # Launchpad objects, looked up (and logged in) only when first
+        # needed, so fully cached queries never talk to launchpad. The dict
+        # is shared with for_version() copies and can be shared between
+        # queries of the same thread.
+        self.objects = objects if objects is not None else {}
+        if launchpad:
+            self.objects['launchpad'] = launchpad
 
-        self.main_archive = ubuntu.main_archive
+        self.arch = arch
+        self.series_name = series
 
-        team = launchpad.people["canonical-kernel-team"]
-        self.ppa = team.getPPAByName(name="ppa")
+        self.set_version(version)
 
-        self.arch = arch
-        self.series = ubuntu.getSeries(name_or_version=series)
-        self.archseries = self.series.getDistroArchSeries(archtag=self.arch)
+    def lp_object(self, name, resolve):
+        if name not in self.objects:
+            self.objects[name] = resolve()
+        return self.objects[name]
+
+    @property
+    def launchpad(self):
+        return self.lp_object('launchpad',
+            lambda: Launchpad.login_anonymously('spork', 'production'))
+
+    @property
+    def ubuntu(self):
+        return self.lp_object('ubuntu',
+            lambda: self.launchpad.distributions["ubuntu"])
 
+    @property
+    def main_archive(self):
+        return self.lp_object('main_archive', lambda: self.ubuntu.main_archive)
+
+    @property
+    def ppa(self):
+        return self.lp_object('ppa', lambda: self.launchpad.people[
+            "canonical-kernel-team"].getPPAByName(name="ppa"))
+
+    @property
+    def series(self):
+        return self.lp_object('series/' + self.series_name,
+            lambda: self.ubuntu.getSeries(name_or_version=self.series_name))
+
+    @property
+    def archseries(self):
+        return self.lp_object('archseries/%s/%s' % (self.series_name, self.arch),
+            lambda: self.series.getDistroArchSeries(archtag=self.arch))
+
+    def set_version(self, version):
         self.version = version
         self.flavor = "generic"
         self.abi = '.'.join(version.split('.')[0:3])
 
+    def for_version(self, version):
+        # Share the launchpad objects, only the version differs.
+        q = copy.copy(self)
+        q.set_version(version)
+        return q
+
+    def query(self, query_type):
+        return getattr(self, QUERY_TYPES[query_type])()
+
     def get_binaries(self, source_name, source_version, filename_filter):
+        urls = self.get_binary_urls(source_name, source_version)
+
+        # Filter through URLs and create a flat list.
+        return filter(lambda k: filename_filter in k, urls)
+
+    def get_binary_urls(self, source_name, source_version):
+        key = "ubuntu/primary/%s/%s/%s" % \
+              (self.series_name, source_name, source_version)
+        if self.cache and not self.refresh:
+            urls = self.cache.get(key)
+            if urls is not None:
+                return urls
+
         pub_sources = self.main_archive.getPublishedSources(
             distro_series=self.series,
             source_name=source_name,
             version=source_version, exact_match=True)
         if not pub_sources:
-            print "%s %s not found." % (source_version, self.arch)
-            exit(1)
+            raise PackageNotFound("%s %s not found." %
+                                  (source_version, self.arch))
 
-        # Filter through URLs and create a flat list.
-        ret = []
+        urls = []
+        statuses = set()
         for pub_source in pub_sources:
-            urls = pub_source.binaryFileUrls()
-            ret = ret + filter(lambda k: filename_filter in k, urls)
+            urls = urls + pub_source.binaryFileUrls()
+            statuses.add(str(pub_source.status))
 
-        # Just return the first element.
-        return ret
+        # The shortest lived status decides how long the entry is kept.
+        if self.cache:
+            status = min(statuses, key=lambda s: PUBLICATION_TTLS.get(s, 0))
+            self.cache.put(key, urls, status)
 
-    def check_url(self, url):
-        try:
-            urllib2.urlopen(url).headers.getheader('Content-Length')
-        except urllib2.HTTPError:
-            print("404 error checking url: " + url)
-            return False
-        return True
+        return urls
 
-    def get_build_log_gcc_version(self):
+    def check_url(self, url):
+        return self.check_urls([url])
+
+    def check_urls(self, urls):
+        # HEAD all urls at once, True if every one of them exists.
+        ok = True
+        for result in self.url_checker.check_all(urls):
+            if not URLChecker.ok(result):
+                sys.stderr.write("%s error checking url: %s\n" %
+                                 (result['status'] or result.get('error'),
+                                  result['url']))
+                ok = False
+        return ok
+
+    def get_build_link(self):
         binary_name="linux-image-%s-generic" % self.abi
         binaries = self.main_archive.getPublishedBinaries(
             binary_name=binary_name, distro_arch_series=self.archseries,
             version=self.version, exact_match=True)
-        build_log_url = binaries[0].build.build_log_url
-        p1 = subprocess.Popen(["wget", "-qO-", build_log_url],
-            stdout=subprocess.PIPE)
-        p2 = subprocess.Popen(["zgrep", "Toolchain package versions"],
-            stdin=p1.stdout, stdout=subprocess.PIPE)
-        p1.stdout.close()
-        package_versions = p2.communicate()[0]
-        p2.stdout.close()
-        gcc_package = filter(lambda x: 'gcc' in x, package_versions.split(' '))
-        return gcc_package[0].split('_')[1]
+        if not binaries:
+            raise PackageNotFound("%s %s not built." %
+                                  (self.version, self.arch))
+
+        # build_link is known without fetching the build itself.
+        return binaries[0].build_link
+
+    def get_build_log_gcc_version(self, build_link):
+        build_log_url = self.launchpad.load(build_link).build_log_url
+        package_versions = find_log_line(build_log_url,
+                                         "Toolchain package versions")
+        if package_versions:
+            gcc_package = filter(lambda x: 'gcc' in x, package_versions.split())
+            if gcc_package:
+                return gcc_package[0].split('_')[1]
+        return None
 
-    def get_gcc_version(self):
-        # Try to get version from build log
-        gcc_version = self.get_build_log_gcc_version()
-        if gcc_version:
-            return gcc_version
-
-        # Use vmlinuz strings to get gcc version
-        kernel_url = self.get_kernel_packages().split(' ')[0]
-        cmd = "wget -q %s -O /tmp/deb && dpkg --fsys-tarfile /tmp/deb | " \
-               % (kernel_url) + \
-              "tar xOf - ./boot/vmlinuz-%s-%s > /tmp/vmlinuz ; " \
-               % (self.abi, self.flavor) + \
-              "strings /tmp/vmlinuz | grep 'gcc version' | cut -d '(' -f 4 | " + \
-              "awk '{ print $2 }' | tr -d ')'"
-
-        p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-        version = p.stdout.readlines()[0].strip()
-
-        if not version:
-            # Worst case we'll need to download the ddeb to get the version.
-            debug_url = self.get_kernel_debug_package()
-            cmd = "wget -q %s -O /tmp/ddeb && dpkg --fsys-tarfile /tmp/ddeb | " \
-                   % (debug_url) + \
-                   "tar xOf - ./usr/lib/debug/boot/vmlinux-%s-%s > /tmp/vmlinux; " \
-                   % (self.abi, self.flavor) + \
-	           "readelf -p .comment /tmp/vmlinux | grep GCC | tr -s ' ' | " + \
-                   " cut -d ' ' -f6 | tr -d ')'"
+    def scan_package(self, url, member_name, pattern):
+        # A deb that can't be read just doesn't answer, the next source is
+        # tried instead.
+        try:
+            return scan_deb_member(url, member_name, pattern)
+        except DebStreamError as e:
+            sys.stderr.write("Couldn't read %s: %s\n" % (url, e))
+            return None
 
-            p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-            version = p.stdout.readlines()[0].strip()
+    def resolve_gcc_version(self, build_link=None):
+        # Returns (gcc version, where it was found). Cheapest source first:
+        # the build log, then the vmlinuz in the kernel deb, then the ddeb.
+        # Whichever answers is cached for the build; an entry without a
+        # version means the log has no toolchain line, so the log isn't
+        # read again.
+        build_link = build_link or self.get_build_link()
+        build_id = build_link.rstrip('/').split('/')[-1]
+        cached = None
+        if self.toolchain_cache and not self.refresh:
+            cached = self.toolchain_cache.get(build_id)
+            if cached and cached['gcc']:
+                return (cached['gcc'], cached.get('source'))
+
+        gcc_version = None
+        source = None
+        if cached is None:
+            gcc_version = self.get_build_log_gcc_version(build_link)
+            source = 'log'
+
+        # Use the vmlinuz gcc banner to get gcc version. The deb is streamed
+        # and the download stops as soon as the banner is found.
+        if not gcc_version:
+            kernel_urls = self.get_kernel_packages()
+            if kernel_urls:
+                gcc_version = self.scan_package(kernel_urls.split(' ')[0],
+                                                "./boot/vmlinuz-%s-%s" %
+                                                (self.abi, self.flavor),
+                                                GCC_BANNER)
+            source = 'vmlinuz'
+
+        if not gcc_version:
+            # Worst case we'll need to stream the ddeb to get the version.
+            debug_url = self.get_kernel_debug_package()
+            if debug_url:
+                gcc_version = self.scan_package(debug_url,
+                    "./usr/lib/debug/boot/vmlinux-%s-%s" %
+                    (self.abi, self.flavor), GCC_COMMENT)
+            source = 'ddeb'
+
+        if not gcc_version:
+            source = None
+        if self.toolchain_cache:
+            self.toolchain_cache.put(build_id, { 'gcc': gcc_version,
+                                                 'source': source }, 'Built')
+        return (gcc_version, source)
 
-        return version
+    def get_gcc_version(self):
+        return self.resolve_gcc_version()[0]
 
     def get_gcc_package(self):
         # Grab gcc version from linux image
@@ -123,13 +285,9 @@ class GetPackageLaunchpadURLQuery:
                  "linux-image-extra-%s-generic_%s_%s.deb" % \
                  (self.abi, self.version, self.arch) ]
 
-        urls = []
-        urls.append(self.get_binaries('linux', self.version, filenames[0])[0])
-        if not self.check_url(urls[0]):
-            return None
-
-        urls.append(self.get_binaries('linux', self.version, filenames[1])[0])
-        if not self.check_url(urls[1]):
+        urls = [ self.get_binaries('linux', self.version, f)[0]
+                 for f in filenames ]
+        if not self.check_urls(urls):
             return None
 
         return(' '.join(urls))
@@ -143,33 +301,327 @@ class GetPackageLaunchpadURLQuery:
             if url and self.check_url(url):
                 return(url)
         except:
-            print("Couldn't find debug package.")
+            sys.stderr.write("Couldn't find debug package.\n")
 
         return None
 
+class BatchQuery:
+    # Resolves many queries with a bounded pool of worker threads. The
+    # launchpadlib HTTP connection can't be shared between threads, so each
+    # worker logs in once (if it needs to) and keeps one query setup per
+    # series/arch.
+
+    def __init__(self, jobs, cache=None, refresh=False, toolchain_cache=None,
+                 url_checker=None, fetcher=None):
+        self.jobs = jobs
+        self.fetcher = fetcher
+        self.cache = cache
+        self.toolchain_cache = toolchain_cache
+        self.url_checker = url_checker or URLChecker(jobs)
+        self.refresh = refresh
+        self.local = threading.local()
+
+    def get_query(self, version, series, arch):
+        if not hasattr(self.local, 'queries'):
+            self.local.objects = {}
+            self.local.queries = {}
+        if (series, arch) not in self.local.queries:
+            self.local.queries[(series, arch)] = GetPackageLaunchpadURLQuery(
+                arch, version, series, self.cache, self.refresh, None,
+                self.toolchain_cache, self.url_checker, self.local.objects)
+        return self.local.queries[(series, arch)].for_version(version)
+
+    def resolve(self, request):
+        (version, series, arch, query_type) = request
+        result = { 'version': version, 'series': series, 'arch': arch,
+                   'type': query_type }
+        try:
+            if query_type not in QUERY_TYPES:
+                raise ValueError("Invalid query type: %s" % query_type)
+            q = self.get_query(version, series, arch)
+            result['result'] = q.query(query_type)
+            if self.fetcher:
+                result['path'] = fetch_result(self.fetcher, query_type,
+                                              result['result'])
+        except Exception as e:
+            result['error'] = str(e) or e.__class__.__name__
+        return result
+
+    def run(self, requests):
+        # Results are yielded as soon as they finish, not in input order.
+        pool = ThreadPool(self.jobs)
+        try:
+            for result in pool.imap_unordered(self.resolve, requests):
+                yield result
+        finally:
+            pool.terminate()
+
+class ToolchainReport:
+    # The gcc version of every published linux upload of some series and
+    # arches. The rows of each series/arch are kept in state_cache, with
+    # when launchpad was last asked, so a rerun only lists uploads published
+    # since then and only resolves those, and earlier ones that weren't
+    # built yet or failed. Progress is saved as it goes, so an interrupted
+    # run picks up where it stopped.
+
+    def __init__(self, batch, state_cache=None):
+        self.batch = batch
+        self.state_cache = state_cache
+
+    def load(self, series, arch):
+        state = None
+        if self.state_cache and not self.batch.refresh:
+            state = self.state_cache.get('%s/%s' % (series, arch))
+        return state or { 'since': None, 'rows': [] }
+
+    def save(self, series, arch, state):
+        if self.state_cache:
+            self.state_cache.put('%s/%s' % (series, arch), state, 'Report')
+
+    def list_uploads(self, series, arch, since):
+        # Two paged listings per series/arch, rather than a lookup per
+        # version. Returns the versions and the build of those built.
+        q = self.batch.get_query('', series, arch)
+        filters = {}
+        if since:
+            filters['created_since_date'] = since
+
+        versions = []
+        for source in q.main_archive.getPublishedSources(
+                source_name='linux', distro_series=q.series,
+                exact_match=True, **filters):
+            version = str(source.source_package_version)
+            if str(source.status) != 'Deleted' and version not in versions:
+                versions.append(version)
+
+        builds = {}
+        for binary in q.main_archive.getPublishedBinaries(
+                binary_name='linux-image-', distro_arch_series=q.archseries,
+                exact_match=False, **filters):
+            version = str(binary.binary_package_version)
+            name = "linux-image-%s-generic" % q.for_version(version).abi
+            if binary.binary_package_name == name:
+                builds[version] = binary.build_link
+        return (versions, builds)
+
+    def resolve(self, row):
+        # Works on a copy, rows are only updated (and saved) by run().
+        row = dict(row)
+        row.pop('error', None)
+        q = self.batch.get_query(row['version'], row['series'], row['arch'])
+        try:
+            if not row.get('build_link'):
+                row['build_link'] = q.get_build_link()
+            row['build'] = row['build_link'].rstrip('/').split('/')[-1]
+            (row['gcc'], row['source']) = q.resolve_gcc_version(
+                row['build_link'])
+            if not row['gcc']:
+                row['error'] = "no gcc version found"
+        except PackageNotFound:
+            # Not built yet, tried again next time.
+            pass
+        except Exception as e:
+            row['error'] = str(e) or e.__class__.__name__
+        return row
+
+    def run(self, series_list, arches):
+        started = datetime.datetime.utcnow().isoformat()
+        states = {}
+        todo = []
+        for series in series_list:
+            for arch in arches:
+                state = self.load(series, arch)
+                (versions, builds) = self.list_uploads(series, arch,
+                                                       state['since'])
+                rows = dict([ (r['version'], r) for r in state['rows'] ])
+                for version in versions:
+                    rows.setdefault(version, { 'series': series,
+                                               'arch': arch,
+                                               'version': version })
+                for (version, build_link) in builds.items():
+                    if version in rows:
+                        rows[version].setdefault('build_link', build_link)
+                rows = sorted(rows.values(),
+                              key=lambda r: version_key(r['version']))
+                states[(series, arch)] = { 'since': started, 'rows': rows }
+                todo += [ r for r in rows if not r.get('gcc') ]
+
+        pool = ThreadPool(self.batch.jobs)
+        saved = time.time()
+        try:
+            for (row, result) in pool.imap_unordered(
+                    lambda r: (r, self.resolve(r)), todo):
+                row.clear()
+                row.update(result)
+                if time.time() - saved >= REPORT_SAVE_INTERVAL:
+                    self.save_all(states)
+                    saved = time.time()
+        finally:
+            pool.terminate()
+            self.save_all(states)
+
+        rows = []
+        for series in series_list:
+            for arch in arches:
+                rows += states[(series, arch)]['rows']
+        return (rows, len(todo))
+
+    def save_all(self, states):
+        for ((series, arch), state) in states.items():
+            self.save(series, arch, state)
+
+def version_key(version):
+    # Good enough for ordering linux versions, e.g. 4.4.0-21.37.
+    return [ int(n) for n in re.findall(r'\d+', version) ]
+
+def write_report(rows, f, output_format):
+    rows = [ dict([ (k, r.get(k)) for k in REPORT_FIELDS ]) for r in rows ]
+    if output_format == 'json':
+        json.dump(rows, f, indent=2, sort_keys=True,
+                  separators=(',', ': '))
+        f.write('\n')
+        return
+    writer = csv.DictWriter(f, REPORT_FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+
+def fetch_result(fetcher, query_type, result):
+    # Download the URLs of a query result into the local store.
+    if query_type not in URL_QUERY_TYPES or not result:
+        return None
+    return ' '.join(fetcher.fetch_all(result.split(' ')))
+
+def read_batch(f):
+    for line in f:
+        fields = line.split('#')[0].split()
+        if not fields:
+            continue
+        if len(fields) != 4:
+            sys.stderr.write("Ignoring malformed line: %s" % line)
+            continue
+        yield tuple(fields)
+
+def parse():
+    parser = argparse.ArgumentParser(
+        description='Get linux related package URLs from launchpad')
+    parser.add_argument('--no-cache', action='store_true',
+                        help="don't read or write the local lookup cache")
+    parser.add_argument('--refresh', action='store_true',
+                        help='ignore cached lookups but store fresh results')
+    parser.add_argument('--batch', '-b', metavar='FILE',
+                        help='read "<version> <series> <arch> <type>" '
+                             'lines from FILE (- for stdin) and print one '
+                             'JSON result per line')
+    parser.add_argument('--jobs', '-j', type=int, default=8,
+                        help='concurrent lookups in batch mode')
+    parser.add_argument('--fetch', '-f', action='store_true',
+                        help='download the resulting packages into the '
+                             'local store and print their paths')
+    parser.add_argument('--report', '-r', metavar='SERIES',
+                        help='comma separated series to report the gcc '
+                             'version of every published linux upload of; '
+                             'reruns only look at new uploads')
+    parser.add_argument('--arches', default='amd64',
+                        help='comma separated arches of the report '
+                             'DEFAULT: amd64')
+    parser.add_argument('--format', choices=[ 'csv', 'json' ], default='csv',
+                        help='report format DEFAULT: csv')
+    parser.add_argument('--output', '-o', metavar='FILE',
+                        help='write the report to FILE instead of stdout')
+    parser.add_argument('--profile', action='store_true',
+                        help='print Launchpad, subprocess and download '
+                             'timings at exit')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='also write a Chrome trace (chrome://tracing) '
+                             'to FILE')
+    parser.add_argument('version', nargs='?')
+    parser.add_argument('series', nargs='?')
+    parser.add_argument('arch', nargs='?')
+    parser.add_argument('type', metavar='type', nargs='?',
+                        help='kernel, debug, gcc or gcc_version')
+    args = parser.parse_args()
+    if not args.batch and not args.report and not args.type:
+        parser.error("<version> <series> <arch> <type>, --batch or --report "
+                     "required")
+    return args
+
+def run_batch(args, cache, toolchain_cache, url_cache):
+    f = sys.stdin if args.batch == '-' else open(args.batch)
+    jobs = max(1, args.jobs)
+    fetcher = Fetcher() if args.fetch else None
+    batch = BatchQuery(jobs, cache, args.refresh, toolchain_cache,
+                       URLChecker(jobs, url_cache, args.refresh), fetcher)
+    failed = False
+    for result in batch.run(list(read_batch(f))):
+        if 'error' in result:
+            failed = True
+        print json.dumps(result, sort_keys=True)
+        sys.stdout.flush()
+    return 1 if failed else 0
+
+def run_report(args, cache, toolchain_cache, url_cache, state_cache):
+    jobs = max(1, args.jobs)
+    batch = BatchQuery(jobs, cache, args.refresh, toolchain_cache,
+                       URLChecker(jobs, url_cache, args.refresh))
+    report = ToolchainReport(batch, state_cache)
+    (rows, resolved) = report.run(args.report.split(','),
+                                  args.arches.split(','))
+
+    f = open(args.output, 'w') if args.output else sys.stdout
+    write_report(rows, f, args.format)
+    if args.output:
+        f.close()
+
+    failed = [ r for r in rows if r.get('error') ]
+    sys.stderr.write("%d uploads, %d looked up, %d without a gcc version\n" %
+                     (len(rows), resolved, len(failed)))
+    return 1 if failed else 0
+
 if __name__ == "__main__":
-    if len(sys.argv) != 5:
-        print("Usage: %s <version> <series> <arch> " % sys.argv[0] + \
-              "<type:kernel,debug,gcc,gcc_version>")
+    args = parse()
+    if args.profile or args.trace:
+        instrument.enable(args.trace)
+
+    cache = None
+    toolchain_cache = None
+    url_cache = None
+    report_cache = None
+    if not args.no_cache:
+        cache = PersistentCache('publications', PUBLICATION_TTLS,
+                                PUBLICATION_CACHE_SIZE)
+        toolchain_cache = PersistentCache('toolchains', TOOLCHAIN_TTLS,
+                                          TOOLCHAIN_CACHE_SIZE)
+        url_cache = PersistentCache('urls', URL_TTLS, URL_CACHE_SIZE)
+        report_cache = PersistentCache('toolchain-report', REPORT_TTLS)
+
+    if args.report:
+        exit(run_report(args, cache, toolchain_cache, url_cache,
+                        report_cache))
+    if args.batch:
+        exit(run_batch(args, cache, toolchain_cache, url_cache))
+
+    VERSION = args.version
+    SERIES = args.series
+    ARCH = args.arch
+    QUERY_TYPE = args.type
+
+    if QUERY_TYPE not in QUERY_TYPES:
+        print "Invalid set argument."
         exit(1)
 
-    VERSION = sys.argv[1]
-    SERIES = sys.argv[2]
-    ARCH = sys.argv[3]
-    QUERY_TYPE = sys.argv[4]
-
-    q = GetPackageLaunchpadURLQuery(ARCH, VERSION, SERIES)
-
-    if QUERY_TYPE == 'debug':
-        print q.get_kernel_debug_package()
-    elif QUERY_TYPE == 'kernel':
-        print q.get_kernel_packages()
-    elif QUERY_TYPE == 'gcc':
-        print q.get_gcc_package()
-    elif QUERY_TYPE == 'gcc_version':
-        print q.get_gcc_version()
-    else:
-        print "Invalid set argument."
+    url_checker = URLChecker(cache=url_cache, refresh=args.refresh)
+    q = GetPackageLaunchpadURLQuery(ARCH, VERSION, SERIES, cache,
+                                    args.refresh,
+                                    toolchain_cache=toolchain_cache,
+                                    url_checker=url_checker)
+
+    try:
+        result = q.query(QUERY_TYPE)
+        if args.fetch:
+            result = fetch_result(Fetcher(), QUERY_TYPE, result)
+        print result
+    except PackageNotFound as e:
+        print e
         exit(1)
 
     exit(0)
@@ -6,14 +6,238 @@
 #
 
 from launchpadlib.launchpad import Launchpad
+from spork.archive import ArchiveStatus
+from spork.cache import PersistentCache
+from spork.debstream import DecompressReader
+from spork.diff import DiffCache, analyze_diff, filter_diff, iter_lines
+from spork.fetch import Fetcher
+from spork import instrument
+from spork.jobs import Backoff, BatchItem, Job, format_summary, log, run_batch, run_jobs
+from spork.viewer import DiffViewer
 from termcolor import colored
+from multiprocessing.pool import ThreadPool
 import argparse
-import pydoc
+import datetime
+import os
+import shutil
 import subprocess
 import sys
+import tempfile
+import threading
 import time
+import urllib2
+import zlib
 
-class ReviewSRUKernel:
+# Publications older than this aren't indexed, lookups for them fall back
+# to asking launchpad about the one package.
+PPA_INDEX_WINDOW = datetime.timedelta(days=365)
+
+# Re-read this much before the last update, in case of clock skew.
+PPA_INDEX_OVERLAP = datetime.timedelta(hours=1)
+
+PPA_INDEX_TTLS = { 'index': None }
+
+# A package's Updates version only changes on release, so it is kept for a
+# while to find cached diffs without asking launchpad.
+BASE_VERSION_TTLS = { 'base': 60 * 60 }
+
+# Files left out of review diffs.
+DIFF_EXCLUDES = [ '*/abi/*' ]
+
+WATCH_TTLS = { 'state': None }
+
+# Polls re-read this much before the previous poll started.
+WATCH_OVERLAP = datetime.timedelta(minutes=5)
+
+# Longest wait between polls after repeated failures.
+WATCH_MAX_BACKOFF = 30 * 60
+
+BUG_STATUSES = [ "New", "Incomplete", "Opinion", "Invalid", "Won't Fix",
+                 "Expired", "Confirmed", "Triaged", "In Progress",
+                 "Fix Committed", "Fix Released" ]
+CLOSED_STATUSES = [ "Opinion", "Invalid", "Won't Fix", "Expired",
+                    "Fix Released" ]
+
+# Give up on a signed UEFI upload that hasn't shown up after this long.
+UEFI_TIMEOUT = 3 * 60 * 60
+
+class UTC(datetime.tzinfo):
+    def utcoffset(self, dt):
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        return 'UTC'
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+def utc_timestamp(dt):
+    # ISO 8601 in UTC with an explicit offset, so launchpad's dates and our
+    # own clock compare (and sort) as strings. Naive datetimes are UTC.
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=UTC())
+    return dt.astimezone(UTC()).isoformat()
+
+def utc_string(timestamp):
+    # For naive timestamps saved by older versions.
+    if timestamp and not (timestamp[-6] in '+-' and timestamp[-3] == ':'):
+        return timestamp + '+00:00'
+    return timestamp
+
+class PPAIndex(object):
+    # PPA publications of one series, keyed by source name and exact
+    # version, and by ABI for the -meta packages.
+
+    statuses = ['Published', 'Superseded']
+
+    def __init__(self, sources=None, watermark=None):
+        # sources: [(name, version, status, date_created)], newest first
+        self.sources = []
+        self.versions = {}
+        self.abis = {}
+        self.latest = {}
+        self.watermark = watermark
+        for source in sources or []:
+            self.add(*source)
+
+    @staticmethod
+    def abi(version):
+        # 4.4.0-22.39 -> 4.4.0-22
+        return '.'.join(version.split('.')[:3])
+
+    @staticmethod
+    def meta_abi(version):
+        # 4.4.0.22.23~14.04.1 -> 4.4.0-22
+        parts = version.split('~')[0].split('.')
+        return '.'.join(parts[:3]) + '-' + '.'.join(parts[3:4])
+
+    @classmethod
+    def matches(cls, package, version, source_version):
+        if '-meta' in package:
+            return cls.meta_abi(source_version) == cls.abi(version)
+        return source_version == version
+
+    def add(self, name, version, status, date_created):
+        self.sources.append((name, version, status, date_created))
+        self.latest.setdefault(name, version)
+        if status not in self.statuses:
+            return
+        self.versions.setdefault((name, version), version)
+        if '-meta' in name:
+            self.abis.setdefault((name, self.meta_abi(version)), version)
+
+    def lookup(self, package, version):
+        if '-meta' in package:
+            return self.abis.get((package, self.abi(version)))
+        return self.versions.get((package, version))
+
+    def update(self, sources, started, published=None, oldest=None):
+        # Newer copies of a publication replace the indexed ones. Pending
+        # uploads will change status, so they get re-read next time.
+        # published holds the (name, version) of everything Published now:
+        # an indexed Published entry missing from it was superseded by a
+        # newer upload of the package, or else deleted. Entries created
+        # before oldest are dropped.
+        fresh = set([ (s[0], s[1]) for s in sources ])
+        merged = sources + [ s for s in self.sources
+                             if (s[0], s[1]) not in fresh ]
+        if published is not None:
+            merged = [ self.restatus(s, published, merged) for s in merged ]
+        if oldest:
+            merged = [ s for s in merged if s[3] >= oldest ]
+        merged.sort(key=lambda s: s[3], reverse=True)
+        self.__init__(merged)
+        pending = [ s[3] for s in merged if s[2] == 'Pending' ]
+        self.watermark = min(pending + [ started ])
+
+    @staticmethod
+    def restatus(source, published, sources):
+        (name, version, status, date_created) = source
+        if status != 'Published' or (name, version) in published:
+            return source
+        newer = [ s for s in sources if s[0] == name and s[3] > date_created ]
+        return (name, version, 'Superseded' if newer else 'Deleted',
+                date_created)
+
+    def to_json(self):
+        return { 'sources': self.sources, 'watermark': self.watermark }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls([ tuple(s[:3]) + (utc_string(s[3]),)
+                     for s in data['sources'] ],
+                   utc_string(data['watermark']))
+
+class UEFIUploadWaiter(threading.Thread):
+    # One thread polls the upload queue for every signed UEFI tarball we're
+    # waiting on, backing off while nothing shows up, and accepts each one
+    # as soon as it appears.
+
+    def __init__(self, review):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.review = review
+        self.pending = {}
+        self.results = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.backoff = Backoff()
+
+    def add(self, bugno, series, name):
+        with self.lock:
+            self.pending[bugno] = (series, name, time.time())
+        self.backoff.reset()
+        self.wakeup.set()
+
+    def close(self):
+        # Waits for everything added so far.
+        self.closed = True
+        self.wakeup.set()
+        self.join()
+
+    def poll(self, bugno, series, name, started):
+        distroseries = self.review.ubuntu.getSeries(name_or_version=series)
+        upload = distroseries.getPackageUploads(status="Unapproved", \
+            name=name, exact_match=True)
+        if len(upload) > 1:
+            return "Something when wrong, UEFI binary not unique."
+        elif len(upload) == 1:
+            upload[0].acceptFromQueue()
+            return "Accepted UEFI binary after %ds" % (time.time() - started)
+        elif time.time() - started > UEFI_TIMEOUT:
+            return "Gave up waiting for UEFI binary"
+        return None
+
+    def run(self):
+        while True:
+            with self.lock:
+                pending = self.pending.items()
+            if not pending and self.closed:
+                return
+
+            for (bugno, (series, name, started)) in pending:
+                try:
+                    result = self.poll(bugno, series, name, started)
+                except Exception as e:
+                    result = "Error waiting for UEFI binary: %s" % e
+                if result:
+                    log(result, "LP: #%s" % bugno)
+                    with self.lock:
+                        del self.pending[bugno]
+                        self.results[bugno] = result
+
+            with self.lock:
+                waiting = len(self.pending)
+            if waiting:
+                log("Waiting for %d UEFI binaries..." % waiting)
+                with instrument.span('wait', 'UEFI upload queue'):
+                    self.wakeup.wait(self.backoff.next())
+            elif not self.closed:
+                self.wakeup.wait()
+            self.wakeup.clear()
+
+class ReviewSRUKernel(object):
 
     package_map = {
         "precise": {
@@ -50,15 +274,82 @@ class ReviewSRUKernel:
     }
 
     def __init__(self, args):
-        self.launchpad = Launchpad.login_with("spork", "production", version="devel")
-        self.ubuntu = self.launchpad.distributions["ubuntu"]
-        self.workflow = self.launchpad.projects["kernel-sru-workflow"]
-        self.me = self.launchpad.me
-        team = self.launchpad.people["canonical-kernel-team"]
-        self.ppa = team.getPPAByName(name="ppa")
-        self.archive = self.ubuntu.main_archive
+        self.local = threading.local()
         self.args = args
 
+        # The download store is only set up if the manual diff path runs.
+        self.store_fetcher = None
+        self.fetcher_lock = threading.Lock()
+
+        # Only one thread builds a given diff, others wait for its result.
+        self.diff_cache = DiffCache()
+        self.diff_locks = {}
+        self.diff_lock = threading.Lock()
+        self.base_versions = None
+        if not args.no_cache:
+            self.base_versions = PersistentCache('base-versions',
+                                                 BASE_VERSION_TTLS)
+
+        # Archive status of every package we know about, fetched on first use.
+        packages = []
+        for series in self.package_map:
+            for packageset in self.package_map[series]:
+                packages.extend(self.package_map[series][packageset])
+        self.archive_status = ArchiveStatus(packages, args.archive_fixture)
+
+        # series -> PPAIndex, built once per run and shared by all threads.
+        self.ppa_indexes = {}
+        self.ppa_index_locks = {}
+        self.ppa_index_lock = threading.Lock()
+        self.ppa_index_cache = None
+        if not args.no_cache:
+            self.ppa_index_cache = PersistentCache('ppa-index', PPA_INDEX_TTLS)
+
+    def session(self):
+        # launchpadlib connections can't be shared between threads, so each
+        # thread logs in on its own and keeps its own objects and bug cache.
+        local = self.local
+        if not hasattr(local, 'objects'):
+            local.objects = {}
+
+            # bugno -> (bug, { workflow task name: task }), filled on first
+            # use and dropped once we lp_save() something on the bug.
+            local.bugs = {}
+        return local
+
+    # Launchpad objects are only looked up (and the login only happens) when
+    # a command first uses them, e.g. status never logs in at all. The
+    # service description is cached by launchpadlib in ~/.launchpadlib.
+    lp_resolvers = {
+        'launchpad': lambda self: Launchpad.login_with("spork", "production", version="devel"),
+        'ubuntu': lambda self: self.launchpad.distributions["ubuntu"],
+        'workflow': lambda self: self.launchpad.projects["kernel-sru-workflow"],
+        'me': lambda self: self.launchpad.me,
+        'ppa': lambda self: self.launchpad.people["canonical-kernel-team"].getPPAByName(name="ppa"),
+        'archive': lambda self: self.ubuntu.main_archive,
+    }
+
+    def lp_object(self, name):
+        objects = self.session().objects
+        if name not in objects:
+            objects[name] = self.lp_resolvers[name](self)
+        return objects[name]
+
+    launchpad = property(lambda self: self.lp_object('launchpad'))
+    ubuntu = property(lambda self: self.lp_object('ubuntu'))
+    workflow = property(lambda self: self.lp_object('workflow'))
+    me = property(lambda self: self.lp_object('me'))
+    ppa = property(lambda self: self.lp_object('ppa'))
+    archive = property(lambda self: self.lp_object('archive'))
+    bugs = property(lambda self: self.session().bugs)
+
+    @property
+    def fetcher(self):
+        with self.fetcher_lock:
+            if self.store_fetcher is None:
+                self.store_fetcher = Fetcher()
+            return self.store_fetcher
+
     def ask(self, message):
         if self.args.yes:
             return True
@@ -69,29 +360,94 @@ class ReviewSRUKernel:
             return True
         return False
 
+    def get_bug(self, bugno):
+        bugno = int(bugno)
+        if bugno not in self.bugs:
+            bug = self.launchpad.bugs[bugno]
+            tasks = {}
+            for task in bug.bug_tasks:
+                target = task.bug_target_name
+                if target.startswith("kernel-sru-workflow/"):
+                    tasks[target.split('/', 1)[1]] = task
+            self.bugs[bugno] = (bug, tasks)
+        return self.bugs[bugno]
+
+    def invalidate_bug(self, bugno):
+        self.bugs.pop(int(bugno), None)
+
     def set_bug_state(self, bugno, status, pocket='proposed'):
-        bug = self.launchpad.bugs[bugno]
-        for task in bug.bug_tasks:
-              if task.bug_target_name == "kernel-sru-workflow/promote-to-%s" % pocket:
-                  if task.status in ["Confirmed", "In Progress"]:
-                      task.status = status
-                      task.assignee = self.me
-                      task.lp_save()
+        (bug, tasks) = self.get_bug(bugno)
+        task = tasks.get("promote-to-%s" % pocket)
+        if task and task.status in ["Confirmed", "In Progress"]:
+            task.status = status
+            task.assignee = self.me
+            task.lp_save()
+            self.invalidate_bug(bugno)
 
     def get_bug_state(self, bugno, workflow_task):
-        bug = self.launchpad.bugs[bugno]
-        for task in bug.bug_tasks:
-              if task.bug_target_name == "kernel-sru-workflow/%s" % workflow_task:
-                  return task.status
+        (bug, tasks) = self.get_bug(bugno)
+        task = tasks.get(workflow_task)
+        if task:
+            return task.status
         return None
 
     def add_bug_message(self, bugno, subject, message):
-        bug = self.launchpad.bugs[bugno]
+        (bug, tasks) = self.get_bug(bugno)
         bug.newMessage(subject=subject, content=message)
         bug.lp_save()
+        self.invalidate_bug(bugno)
+
+    def get_base_source(self, package_name, distroseries):
+        # We diff against Updates, but in the rare case that this is
+        # the first SRU, we'll need to diff against the Release pocket.
+        try:
+            return self.archive.getPublishedSources(
+                source_name=package_name, distro_series=distroseries,
+                pocket='Updates', status='Published',  exact_match=True)[0]
+        except:
+            return self.archive.getPublishedSources(
+                source_name=package_name, distro_series=distroseries,
+                pocket='Release', status='Published',  exact_match=True)[0]
+
+    def lookup_diff(self, key):
+        kinds = [ 'manual' ] if self.args.manual else [ 'launchpad', 'manual' ]
+        if not self.args.no_cache:
+            for kind in kinds:
+                path = self.diff_cache.lookup(kind, *key)
+                if path:
+                    return path
+        return None
+
+    def get_diff_path(self, package_name, version, series, quiet=False):
+        # Returns the path of the filtered diff in the local diff cache,
+        # building it first if needed.
+        base_key = "%s/%s" % (series, package_name)
+        if self.base_versions:
+            old_version = self.base_versions.get(base_key)
+            if old_version:
+                path = self.lookup_diff((package_name, old_version, version))
+                if path:
+                    return path
 
-    def get_diff(self, package_name, version, series):
         distroseries = self.ubuntu.getSeries(name_or_version=series)
+        old_source = self.get_base_source(package_name, distroseries)
+        old_version = str(old_source.source_package_version)
+        if self.base_versions:
+            self.base_versions.put(base_key, old_version, 'base')
+        key = (package_name, old_version, version)
+
+        with self.diff_lock:
+            lock = self.diff_locks.setdefault(key, threading.Lock())
+        with lock:
+            path = self.lookup_diff(key)
+            if path:
+                return path
+            return self.build_diff(package_name, version, distroseries,
+                                   old_source, quiet)
+
+    def build_diff(self, package_name, version, distroseries, old_source,
+                   quiet=False):
+        old_version = str(old_source.source_package_version)
         new_source = self.ppa.getPublishedSources(source_name=package_name,
             version=version, distro_series=distroseries, exact_match=True, status='Published')[0]
         if not new_source:
@@ -109,62 +465,105 @@ class ReviewSRUKernel:
             url = new_source.packageDiffUrl(to_version=version)
         except:
             # Try to construct diff manually.
-            # We diff against Updates, but in the rare case that this is
-            # the first SRU, we'll need to diff against the Release pocket.
-            print "Launchpad diff pending, constructing diff manually."
-            try:
-                old_source = self.archive.getPublishedSources(
-                    source_name=package_name, distro_series=distroseries,
-                    pocket='Updates', status='Published',  exact_match=True)[0]
-            except:
-                old_source = self.archive.getPublishedSources(
-                    source_name=package_name, distro_series=distroseries,
-                    pocket='Release', status='Published',  exact_match=True)[0]
+            if not quiet:
+                print "Launchpad diff pending, constructing diff manually."
             old_dsc = [ f for f in old_source.sourceFileUrls() if f.endswith('.dsc') ][0]
             new_dsc = [ f for f in new_source.sourceFileUrls() if f.endswith('.dsc') ][0]
             old_filename = old_dsc.split('/')[-1]
             new_filename = new_dsc.split('/')[-1]
-            subprocess.call(["mkdir","-p","temp"])
-            subprocess.call(["dget", "-q", "-u", old_dsc], cwd='temp')
-            subprocess.call(["dget", "-q", "-u", new_dsc], cwd='temp')
-            p1 = subprocess.Popen(["debdiff",
-                "%s" % old_filename, "%s" % new_filename],
-                stdout=subprocess.PIPE, cwd='temp')
-            p2 = subprocess.Popen(["filterdiff -x '*/abi/*'"],
-                stdin=p1.stdout, stdout=subprocess.PIPE, shell=True, cwd='temp')
-            p1.stdout.close()
-            output = p2.communicate()[0]
-            return output
-
-        # Download and filter diff
-        p1 = subprocess.Popen(["wget", "-qO-", url], stdout=subprocess.PIPE)
-        p2 = subprocess.Popen(["zcat | filterdiff -x '*/abi/*'"],
-            stdin=p1.stdout, stdout=subprocess.PIPE, shell=True)
-        p1.stdout.close()
-        output = p2.communicate()[0]
-
-        return output
-
-    def display_diff(self, text):
-        pydoc.pipepager(text, "view -c 'set syntax=diff' -")
+            # Sources come from the shared store, so orig tarballs are only
+            # downloaded once across reviews. Each diff gets a directory of
+            # its own, so concurrent builds don't trip over each other.
+            temp = tempfile.mkdtemp(prefix='spork-diff-')
+            try:
+                self.fetcher.fetch_source(old_dsc, temp)
+                self.fetcher.fetch_source(new_dsc, temp)
+                stderr = open(os.devnull, 'w') if quiet else None
+                p = subprocess.Popen(["debdiff",
+                    "%s" % old_filename, "%s" % new_filename],
+                    stdout=subprocess.PIPE, stderr=stderr, cwd=temp)
+                try:
+                    return self.diff_cache.store('manual', package_name,
+                        old_version, version,
+                        filter_diff(p.stdout, DIFF_EXCLUDES))
+                finally:
+                    p.stdout.close()
+                    p.wait()
+            finally:
+                shutil.rmtree(temp, ignore_errors=True)
+
+        # Download, unpack and filter diff as it arrives
+        with instrument.span('download', url):
+            response = urllib2.urlopen(url)
+            try:
+                diff = DecompressReader(response,
+                                        zlib.decompressobj(16 + zlib.MAX_WBITS))
+                return self.diff_cache.store('launchpad', package_name,
+                    old_version, version,
+                    filter_diff(iter_lines(diff), DIFF_EXCLUDES))
+            finally:
+                response.close()
+
+    def warm_diffs(self, series, package_versions):
+        # Runs in the background, so review finds the diffs ready. Quietly:
+        # review runs into the same errors itself, when it gets there.
+        for (package, package_version, found) in package_versions:
+            if not found:
+                continue
+            try:
+                self.get_diff_path(package, package_version, series, True)
+            except Exception:
+                pass
+
+    def warm_detached(self, work):
+        # list is done once it has printed, so the diffs are prepared by a
+        # child process that outlives it.
+        if not work or os.fork():
+            return
+        try:
+            os.setsid()
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            # Don't share the parent's launchpad or sqlite connections.
+            self.local = threading.local()
+            if self.base_versions:
+                self.base_versions = PersistentCache('base-versions',
+                                                     BASE_VERSION_TTLS)
+            pool = ThreadPool(max(1, self.args.jobs))
+            pool.map(lambda w: self.warm_diffs(*w), work)
+        finally:
+            os._exit(0)
+
+    def display_diff(self, path, report):
+        viewer = DiffViewer(path, report)
+        if self.args.yes:
+            viewer.show(range(len(report.files)))
+        else:
+            viewer.run()
 
     def status(self, pocket):
         if pocket != 'proposed' and pocket != 'updates':
             print "Invalid pocket"
             exit(1)
 
+        try:
+            self.archive_status.load()
+        except (subprocess.CalledProcessError, OSError, IOError):
+            print("Error getting status")
+            exit(1)
+
         for series in self.package_map:
             for packageset in self.package_map[series]:
-                packages = ' '.join(self.package_map[series][packageset])
-                cmd = "rmadison -a source %s | grep %s-%s" % ( packages, series, pocket )
-                try:
-                    output = subprocess.check_output([cmd], shell=True).split('\n')
-                    for line in output:
-                        s = line.split('|')
-                        print colored(s[0].rstrip(),'yellow').ljust(42) + " " + colored(s[1].rstrip(), 'green').ljust(32) + " " + s[2].rstrip()
-                except: pass
+                packages = self.package_map[series][packageset]
+                suite = "%s-%s" % (series, pocket)
+                for record in self.archive_status.query(packages, suite):
+                    s = record.line.split('|')
+                    print colored(s[0].rstrip(),'yellow').ljust(42) + " " + colored(s[1].rstrip(), 'green').ljust(32) + " " + s[2].rstrip()
 
     def promote_kernel_set(self, bugnos):
+        # Confirm everything up front, then copy all sets concurrently.
+        sets = []
         for bugno in bugnos:
             (packageset, series, version) = self.extract_fields_from_bug(bugno)
 
@@ -173,49 +572,72 @@ class ReviewSRUKernel:
                 print("Invalid package set: %s" % packageset)
                 exit(1)
 
-            # Get variables
-            distroseries = self.ubuntu.getSeries(name_or_version=series)
-            packages = self.package_map[series][packageset]
-            base_package = packages[0]
-
             # Ask for confirmation
             print("LP: #%s %s %s -> %s-proposed" % (bugno, packageset, version, series))
             if not self.ask("Accept into proposed? "):
-                return
+                break
+            sets.append((bugno, packageset, series, version))
 
-            # Copy everything over at once
-            set_has_signed=False
+        # Copy everything over at once
+        jobs = []
+        remaining = {}
+        for (bugno, packageset, series, version) in sets:
+            packages = self.package_map[series][packageset]
+            remaining[bugno] = len(packages)
             for package in packages:
-                output = None
                 cmd = ["copy-proposed-kernel", series, package]
                 print("Calling: " + ' '.join(cmd))
-                subprocess.Popen(cmd)
-
-                if "signed" in package:
-                    set_has_signed=True
-
-            # Process UEFI stuff
-            if set_has_signed:
-                upload=None
-                while True:
-                    # Wait some time for UEFI binary to become available
-                    upload = distroseries.getPackageUploads(status="Unapproved", \
-                        name="%s_%s_amd64.tar.gz" % (base_package, version), exact_match=True)
-                    if len(upload) > 1:
-                        print("Something when wrong, UEFI binary not unique.")
-                        exit(1)
-                    elif len(upload) == 1:
-                        break
-
-                    print("Waiting for UEFI binary...")
-                    time.sleep(10)
-
-                upload[0].acceptFromQueue()
-                print("Accepted UEFI binary!")
+                jobs.append(Job(cmd, "LP: #%s %s" % (bugno, package), key=bugno))
+
+        # Process UEFI stuff, once all of a set's packages are copied.
+        waiter = UEFIUploadWaiter(self)
+        waiter.start()
+        failed = set()
+        for job in run_jobs(jobs, self.args.jobs):
+            bugno = job.key
+            remaining[bugno] -= 1
+            if not job.ok:
+                failed.add(bugno)
+            if remaining[bugno] or bugno in failed:
+                continue
+            (bugno, packageset, series, version) = [ s for s in sets if s[0] == bugno ][0]
+            packages = self.package_map[series][packageset]
+            if any(["signed" in package for package in packages]):
+                waiter.add(bugno, series, "%s_%s_amd64.tar.gz" % (packages[0], version))
+        waiter.close()
 
+        # Summary
+        for job in jobs:
+            status = "ok" if job.ok else colored(job.error or "exit %d" % job.returncode, 'red')
+            print("%-40s %7.1fs %s" % (job.label, job.duration, status))
+        for (bugno, packageset, series, version) in sets:
+            if bugno in failed:
+                print(colored("LP: #%s copy failed" % bugno, 'red'))
+            elif bugno in waiter.results:
+                print("LP: #%s %s" % (bugno, waiter.results[bugno]))
+        if sets and not failed:
             print("Copied all packages")
 
+    def run_command(self, cmd, label):
+        job = Job(cmd, label).run()
+        if not job.ok:
+            raise Exception(job.error or "%s exited with %d" % (cmd[0], job.returncode))
+
+    def run_bug_batch(self, items, work):
+        # Runs work(item) for all confirmed bugs at once and prints how long
+        # each step took.
+        start = time.time()
+        items = run_batch(items, work, self.args.jobs)
+        print("")
+        for line in format_summary(items):
+            print(line)
+        print("%d bugs, %d failed, %.1fs" % (len(items),
+              len([ i for i in items if not i.ok ]), time.time() - start))
+        return items
+
     def release(self, bugnos):
+        # Ask about every bug first, then release them all concurrently.
+        items = []
         for bugno in bugnos:
             (packageset, series, version) = self.extract_fields_from_bug(bugno)
 
@@ -227,12 +649,19 @@ class ReviewSRUKernel:
             # Ask for confirmation
             print("LP: #%s %s %s -> %s-updates security=%s" % (bugno, packageset, version, series, security))
             if not self.ask("Release into updates? "):
-                return
+                break
+
+            items.append(BatchItem(bugno, "LP: #%s" % bugno,
+                                   (packageset, series, version, security)))
+
+        def work(item):
+            bugno = item.key
+            (packageset, series, version, security) = item.data
 
             # Assign to updates/security if necessary
-            self.set_bug_state(bugno, "In Progress", "updates")
+            item.step("updates", self.set_bug_state, bugno, "In Progress", "updates")
             if security:
-                self.set_bug_state(bugno, "In Progress", "security")
+                item.step("security", self.set_bug_state, bugno, "In Progress", "security")
 
             # Release the kernel!
             packages = self.package_map[series][packageset]
@@ -242,10 +671,14 @@ class ReviewSRUKernel:
                 cmd = ["sru-release", "--no-bugs", series]
 
             cmd.extend(packages)
-            print(" ".join(cmd))
-            subprocess.Popen(cmd)
+            log(" ".join(cmd), item.label)
+            item.step("sru-release", self.run_command, cmd, item.label)
+
+        self.run_bug_batch(items, work)
 
     def finish(self, bugnos, pocket="updates"):
+        # Ask about every bug first, then update them all concurrently.
+        confirmed = []
         for bugno in bugnos:
             # Determine information.
             (packageset, series, version) = self.extract_fields_from_bug(bugno)
@@ -254,67 +687,141 @@ class ReviewSRUKernel:
 
             # Get status
             status = ""
-            packages = ' '.join(self.package_map[series][packageset])
-            cmd = "rmadison -a source %s | grep %s-%s" % ( packages, series, pocket)
+            packages = self.package_map[series][packageset]
+            suite = "%s-%s" % (series, pocket)
             try:
-                status = subprocess.check_output([cmd], shell=True).rstrip("\n\r")
-            except:
+                records = self.archive_status.query(packages, suite)
+            except (subprocess.CalledProcessError, OSError, IOError):
+                records = None
+            if not records:
                 print("Error getting status")
                 exit(1)
+            status = '\n'.join([ r.line for r in records ])
 
             text = "Promoted to %s:\n%s" % (pocket.capitalize(), status)
             print text
 
             # Look good?
+            item = BatchItem(bugno, "LP: #%s" % bugno,
+                             (packageset, series, version, status))
             if self.ask("Does this look correct? "):
-                # Set bug states to Fix Committed
-                if pocket == "updates":
-                    self.set_bug_state(bugno, "Fix Committed", "updates")
-                    self.set_bug_state(bugno, "Fix Committed", "security")
-                else:
-                    self.set_bug_state(bugno, "Fix Committed", "proposed")
+                confirmed.append(item)
 
-                # Set bug message
-                self.add_bug_message(bugno, "Promoted to " + pocket.capitalize(), status)
+        def work(item):
+            bugno = item.key
+            status = item.data[3]
 
-            # Print output message
-            wording = "released" if pocket == "updates" else "promoted"
-            print("* LP: #%s - %s %s %s to %s-%s" % (bugno, wording, packageset, version, series, pocket))
+            # Set bug states to Fix Committed
+            if pocket == "updates":
+                item.step("updates", self.set_bug_state, bugno, "Fix Committed", "updates")
+                item.step("security", self.set_bug_state, bugno, "Fix Committed", "security")
+            else:
+                item.step("proposed", self.set_bug_state, bugno, "Fix Committed", "proposed")
 
-    def list_ppa_packages(self, series, packageset, version):
+            # Set bug message
+            item.step("message", self.add_bug_message, bugno, "Promoted to " + pocket.capitalize(), status)
+
+        done = self.run_bug_batch(confirmed, work)
+
+        # Print output message, for the bugs that went through only
+        wording = "released" if pocket == "updates" else "promoted"
+        for item in [ i for i in done if i.ok ]:
+            (packageset, series, version, status) = item.data
+            print("* LP: #%s - %s %s %s to %s-%s" % (item.key, wording, packageset, version, series, pocket))
+
+    def get_ppa_index(self, series):
+        with self.ppa_index_lock:
+            lock = self.ppa_index_locks.setdefault(series, threading.Lock())
+        with lock:
+            if series not in self.ppa_indexes:
+                self.ppa_indexes[series] = self.load_ppa_index(series)
+            return self.ppa_indexes[series]
+
+    def refresh_ppa_indexes(self):
+        # Pick up new uploads for every series indexed so far.
+        for series in list(self.ppa_indexes):
+            self.ppa_indexes[series] = self.load_ppa_index(series,
+                self.ppa_indexes[series])
+
+    def load_ppa_index(self, series, index=None):
+        # Start from the copy saved by the last run, if any, and only ask
+        # for publications created since then.
+        if index is None:
+            index = PPAIndex()
+            if self.ppa_index_cache:
+                cached = self.ppa_index_cache.get(series)
+                if cached:
+                    index = PPAIndex.from_json(cached)
+
+        now = datetime.datetime.now(UTC())
+        oldest = utc_timestamp(now - PPA_INDEX_WINDOW)
+        since = max(index.watermark or oldest, oldest)
+
+        distroseries = self.ubuntu.getSeries(name_or_version=series)
+        sources = []
+        for source in self.ppa.getPublishedSources(distro_series=distroseries,
+                                                   created_since_date=since):
+            sources.append((str(source.source_package_name),
+                            str(source.source_package_version),
+                            str(source.status),
+                            utc_timestamp(source.date_created)))
+
+        # Only new publications are listed above, so the statuses of the
+        # indexed ones are checked against what is Published now.
+        published = None
+        if index.sources:
+            published = set([ (str(s.source_package_name),
+                               str(s.source_package_version))
+                              for s in self.ppa.getPublishedSources(
+                                  distro_series=distroseries,
+                                  status='Published') ])
+        index.update(sources, utc_timestamp(now - PPA_INDEX_OVERLAP),
+                     published, oldest)
+
+        if self.ppa_index_cache:
+            self.ppa_index_cache.put(series, index.to_json(), 'index')
+        return index
+
+    def find_ppa_source(self, series, package, version):
+        # Slow path for versions older than the index window.
         distroseries = self.ubuntu.getSeries(name_or_version=series)
+        sources = self.ppa.getPublishedSources(source_name=package,
+            distro_series=distroseries)
+        for source in sources:
+            source_version = str(source.source_package_version)
+            if str(source.status) in PPAIndex.statuses and \
+               PPAIndex.matches(package, version, source_version):
+                return source_version
+        return None
+
+    def list_ppa_packages(self, series, packageset, version):
         packages = self.package_map[series][packageset]
-        abi = '.'.join(version.split('.')[:3])
+        index = self.get_ppa_index(series)
 
         package_versions = []
         for package in packages:
-	    sources = self.ppa.getPublishedSources(source_name=package,
-                distro_series=distroseries)
-
-            # Match version with source and correct status depending on package
-            found_match = False
-            for source in sources:
-                source_version = str(source.source_package_version)
-                source_status = str(source.status)
-                if source_status in ['Published', 'Superseded']:
-                    if '-meta' in package:
-                        if abi.replace('-','.') in source_version:
-                            found_match = True
-                            break
-                    else:
-                        if version in source_version:
-                            found_match = True
-                            break
+            # Match version (or ABI for -meta) exactly with an indexed source
+            source_version = index.lookup(package, version)
+            if not source_version:
+                source_version = self.find_ppa_source(series, package, version)
+            found_match = source_version is not None
             if not found_match:
-                print("Couldn't find %s %s %s in the PPA" % (packageset, series, abi))
+                source_version = index.latest.get(package)
 
-            print "\t" + colored(str(package), 'white', attrs=['underline']) + " " + colored(source_version, 'green')
-            package_versions.append((package, source_version))
+            package_versions.append((package, source_version, found_match))
 
         return package_versions
 
+    def print_ppa_packages(self, series, packageset, version, package_versions):
+        abi = '.'.join(version.split('.')[:3])
+        for (package, source_version, found_match) in package_versions:
+            if not found_match:
+                print("Couldn't find %s %s %s in the PPA" % (packageset, series, abi))
+
+            print "\t" + colored(str(package), 'white', attrs=['underline']) + " " + colored(str(source_version), 'green')
+
     def extract_fields_from_bug(self, bugno):
-        bug = self.launchpad.bugs[bugno]
+        (bug, tasks) = self.get_bug(bugno)
         title = bug.title
 
         packageset = str(title.split(' ')[0]).replace(':','').replace('"','')
@@ -322,70 +829,312 @@ class ReviewSRUKernel:
         (series,) = set(bug.tags).intersection(self.package_map.keys())
         return (packageset, series, version)
 
+    def fetch_workflow_bug(self, bugno):
+        # Runs on a worker thread: collects everything list needs to print
+        # for one tracking bug, or None if nothing is waiting for promotion.
+        (bug, tasks) = self.get_bug(bugno)
+        subtasks = [ (name, tasks[name]) for name in sorted(tasks)
+                     if name.startswith("promote-to-") and
+                        tasks[name].status in ['Confirmed', 'In Progress'] ]
+        if not subtasks:
+            return None
+
+        (packageset, series, version) = self.extract_fields_from_bug(bugno)
+        package_versions = self.list_ppa_packages(series, packageset, version)
+
+        rows = []
+        for (name, subtask) in subtasks:
+            # Use the links, fetching the person only for its name is slow.
+            assignee = None
+            if subtask.assignee_link:
+                assignee = subtask.assignee_link.split('~')[-1]
+            rows.append({
+                'name': name,
+                'status': str(subtask.status),
+                'task_type': name.replace('promote-to-', '->'),
+                'assignee': str(assignee),
+            })
+        return (rows, packageset, series, version, package_versions)
+
     def list_sru_workflow(self, review=False):
+        # Tracking bugs are fetched concurrently, but printed (and reviewed)
+        # in searchTasks() order as soon as each one is ready.
+        workflow_bugnos = []
+        for task in self.workflow.searchTasks():
+            bugno = str(task.bug_link.split('/')[-1])
+            if bugno not in workflow_bugnos:
+                workflow_bugnos.append(bugno)
+
+        # Diffs are warmed while review prompts, or after list has printed.
         bugnos = []
-        workflow_tasks = self.workflow.searchTasks()
-        for task in workflow_tasks:
-            for subtask in task.related_tasks:
-              if "kernel-sru-workflow/promote-to-" in subtask.bug_target_name:
-                  if subtask.status == 'Confirmed' or subtask.status == 'In Progress':
-
-                      bugno = str(subtask.bug.id)
-                      bugnos.append(bugno)
-                      status = str(subtask.status)
-                      title = str(subtask.title)
-                      task_type = str(title.split(' ')[6]).replace(':','').replace('"','').replace('promote-to-','->')
-                      assignee = str(subtask.assignee.name)
-                      (packageset, series, version) = self.extract_fields_from_bug(bugno)
-
-                      # set colors
-                      status_color = 'green' if status == 'In Progress' else 'red'
-                      assignee_color = 'green' if assignee == 'arges' else 'red'
-
-                      print colored("LP: #" + bugno, 'white',attrs=['bold','underline']) + " " + \
-                          colored(status, status_color) + " " + \
-                          colored(assignee, assignee_color) + " " + colored(task_type, 'green') + " " + \
-                          colored(series, 'yellow') + " " + colored(packageset, 'yellow')
-
-                      # list all source packages and versions
-                      package_versions = self.list_ppa_packages(series, packageset, version)
-
-                      # Check for review mode.
-                      if review:
-                          # Check if this is a proposed issue
-                          if "kernel-sru-workflow/promote-to-proposed" in subtask.bug_target_name:
-                              if self.ask('Review this bug? '):
-                                  if status != 'In Progress' and assignee != 'arges':
-                                      print('Assigning...')
-                                      self.set_bug_state(bugno, "In Progress")
-                                      print("%s assigned and set to: %s" %( bugno, "In Progress" ))
-                                  print('Reviewing...')
-                                  for package_version in package_versions:
-                                      package = package_version[0]
-                                      version = package_version[1]
-                                      diff = self.get_diff(package, version, series)
-                                      r.display_diff(diff)
+        warm = []
+        pool = ThreadPool(max(1, self.args.jobs))
+        # One pool checks the bugs of every reviewed package, so its
+        # workers log in to launchpad once per review.
+        check_pool = None
+        if review:
+            check_pool = ThreadPool(max(1, self.args.jobs))
+        warm_pool = None
+        if self.args.warm and review:
+            warm_pool = ThreadPool(max(1, self.args.jobs))
+        try:
+            for (bugno, result) in zip(workflow_bugnos,
+                    pool.imap(self.fetch_workflow_bug, workflow_bugnos)):
+                if not result:
+                    continue
+                (rows, packageset, series, version, package_versions) = result
+                if self.args.warm and 'promote-to-proposed' in [ r['name'] for r in rows ]:
+                    warm.append((series, package_versions))
+                    if warm_pool:
+                        warm_pool.apply_async(self.warm_diffs, (series, package_versions))
+                for row in rows:
+                    bugnos.append(bugno)
+                    status = row['status']
+                    assignee = row['assignee']
+
+                    # set colors
+                    status_color = 'green' if status == 'In Progress' else 'red'
+                    assignee_color = 'green' if assignee == 'arges' else 'red'
+
+                    print colored("LP: #" + bugno, 'white',attrs=['bold','underline']) + " " + \
+                        colored(status, status_color) + " " + \
+                        colored(assignee, assignee_color) + " " + colored(row['task_type'], 'green') + " " + \
+                        colored(series, 'yellow') + " " + colored(packageset, 'yellow')
+
+                    # list all source packages and versions
+                    self.print_ppa_packages(series, packageset, version, package_versions)
+
+                    # Check for review mode.
+                    if review:
+                        # Check if this is a proposed issue
+                        if row['name'] == "promote-to-proposed":
+                            if self.ask('Review this bug? '):
+                                if status != 'In Progress' and assignee != 'arges':
+                                    print('Assigning...')
+                                    self.set_bug_state(bugno, "In Progress")
+                                    print("%s assigned and set to: %s" %( bugno, "In Progress" ))
+                                print('Reviewing...')
+                                for (package, package_version, found) in package_versions:
+                                    # Without an upload there's no version to diff.
+                                    if not found:
+                                        print("Couldn't find %s in the %s PPA" % (package, series))
+                                        continue
+                                    path = self.get_diff_path(package, package_version, series)
+                                    (report, problems) = self.sanity_check(package, package_version, series, path, check_pool)
+                                    if problems and not self.ask('View diff anyway? '):
+                                        continue
+                                    self.display_diff(path, report)
+        finally:
+            pool.terminate()
+            if check_pool:
+                check_pool.terminate()
+            # Whatever wasn't needed by the end of review isn't waited for,
+            # the workers are daemon threads.
+            if warm_pool:
+                warm_pool.close()
 
         if bugnos:
-            print("Listed bugs: " + ' '.join(list(set(bugnos))))
+            print("Listed bugs: " + ' '.join(sorted(set(bugnos))))
+        if warm and not review:
+            print("Preparing diffs of %d bugs in the background" % len(warm))
+            sys.stdout.flush()
+            self.warm_detached(warm)
+
+
+    def fetch_bug_state(self, bugno):
+        # Runs on a worker thread: current workflow state of a tracking bug,
+        # or None if it isn't one we can handle.
+        self.invalidate_bug(bugno)
+        (bug, tasks) = self.get_bug(bugno)
+        try:
+            (packageset, series, version) = self.extract_fields_from_bug(bugno)
+        except ValueError:
+            return None
+        if packageset not in self.package_map.get(series, {}):
+            return None
+
+        ppa = {}
+        for (package, source_version, found) in self.list_ppa_packages(series, packageset, version):
+            ppa[package] = source_version if found else None
+        return {
+            'packageset': packageset,
+            'series': series,
+            'version': version,
+            'tasks': dict([ (name, str(task.status)) for (name, task) in tasks.items() ]),
+            'ppa': ppa,
+        }
+
+    def print_watch_delta(self, bugno, old, new):
+        bug = colored("LP: #%s" % bugno, 'white', attrs=['bold'])
+        if not old:
+            print bug + " " + colored("new", 'green') + " %s %s %s" % \
+                (new['packageset'], new['version'], new['series'])
+            return
+        for name in sorted(new['tasks']):
+            status = new['tasks'][name]
+            if old['tasks'].get(name) != status:
+                print bug + " %s: %s -> %s" % (name,
+                    old['tasks'].get(name), colored(status, 'yellow'))
+        for package in sorted(new['ppa']):
+            version = new['ppa'][package]
+            if old['ppa'].get(package) != version and version:
+                print bug + " %s %s in the PPA" % (package, colored(version, 'green'))
 
+    def watch(self, interval, once=False):
+        # Polls the workflow for bugs changed since the last poll and prints
+        # what changed. The state is kept on disk between runs. A failed
+        # poll is retried with backoff, the watcher keeps running.
+        cache = None
+        state = { 'last_poll': None, 'bugs': {} }
+        if not self.args.no_cache:
+            cache = PersistentCache('watch', WATCH_TTLS)
+            state = cache.get('state') or state
+            state['last_poll'] = utc_string(state['last_poll'])
 
-    def sanity_check(self):
-        print("sanity check")
-        # all bugs public?
-        # all bugs targeted correctly?
-        # changes file looks correct
-        #   diff.gz => {linux}
-        #   tar.gz => {linux-meta,linux-signed}
-        # check diff size < 7MB (WARNING)
-        # no swp or random binary files
-        # no large amounts of removed files
+        backoff = Backoff(interval, 2, max(interval, WATCH_MAX_BACKOFF))
+        pool = ThreadPool(max(1, self.args.jobs))
+        try:
+            while True:
+                delay = interval
+                try:
+                    self.poll_watch(state, pool)
+                    backoff.reset()
+                except Exception as e:
+                    delay = backoff.next()
+                    log("Poll failed: %s" % (str(e) or e.__class__.__name__))
+                    if not once:
+                        log("Retrying in %ds" % delay)
+                if cache:
+                    cache.put('state', state, 'state')
+                sys.stdout.flush()
+
+                if once:
+                    return
+                time.sleep(delay)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.terminate()
+
+    def poll_watch(self, state, pool):
+        # The first poll only records where things are, rather than
+        # reporting every task of every bug as new.
+        first = state['last_poll'] is None
+        started = datetime.datetime.utcnow()
+        self.refresh_ppa_indexes()
+
+        if state['last_poll']:
+            tasks = self.workflow.searchTasks(
+                modified_since=state['last_poll'], status=BUG_STATUSES)
+        else:
+            tasks = self.workflow.searchTasks()
+
+        changed = []
+        for task in tasks:
+            bugno = str(task.bug_link.split('/')[-1])
+            if str(task.status) in CLOSED_STATUSES:
+                if bugno in state['bugs']:
+                    print colored("LP: #%s" % bugno, 'white', attrs=['bold']) + \
+                        " closed (%s)" % task.status
+                    del state['bugs'][bugno]
+            elif bugno not in changed:
+                changed.append(bugno)
+
+        for (bugno, new) in zip(changed, pool.imap(self.fetch_bug_state, changed)):
+            if new:
+                if not first:
+                    self.print_watch_delta(bugno, state['bugs'].get(bugno), new)
+                state['bugs'][bugno] = new
+
+        # PPA uploads don't touch the bugs, check the others against the
+        # refreshed index.
+        for bugno in state['bugs']:
+            if bugno in changed:
+                continue
+            old = state['bugs'][bugno]
+            index = self.get_ppa_index(old['series'])
+            new = dict(old, ppa=dict(old['ppa']))
+            for package in new['ppa']:
+                new['ppa'][package] = index.lookup(package, old['version']) or \
+                    old['ppa'][package]
+            self.print_watch_delta(bugno, old, new)
+            state['bugs'][bugno] = new
+
+        state['last_poll'] = utc_timestamp(started - WATCH_OVERLAP)
+        if first:
+            print("Watching %d tracking bugs" % len(state['bugs']))
+
+    def check_source_format(self, package, version, series):
+        # diff.gz => {linux}
+        # tar.gz => {linux-meta,linux-signed}
+        distroseries = self.ubuntu.getSeries(name_or_version=series)
+        sources = self.ppa.getPublishedSources(source_name=package,
+            version=version, distro_series=distroseries, exact_match=True)
+        if not sources:
+            return [ "no %s %s source in the PPA" % (package, version) ]
+        files = sources[0].sourceFileUrls()
+        has_diff = any([ f.endswith('.diff.gz') for f in files ])
+        has_tar = any([ f.endswith('.tar.gz') for f in files ])
+
+        native = any([ n in package for n in ['-meta', '-signed', '-backports-modules'] ])
+        if native and (has_diff or not has_tar):
+            return [ "%s should be a native tar.gz upload" % package ]
+        if not native and not has_diff:
+            return [ "%s upload has no diff.gz" % package ]
+        return []
+
+    def check_bug(self, bugno, series):
+        # Every bug an SRU fixes must be public and nominated for the series.
+        target = "(Ubuntu %s)" % series.capitalize()
+        try:
+            bug = self.launchpad.bugs[bugno]
+            if bug.private:
+                return [ "LP: #%d is private" % bugno ]
+            if not any([ t.bug_target_name.endswith(target)
+                         for t in bug.bug_tasks ]):
+                return [ "LP: #%d isn't targeted to %s" % (bugno, series) ]
+        except Exception:
+            return [ "LP: #%d can't be looked up" % bugno ]
+        return []
+
+    def check_bugs(self, bugnos, series, pool):
+        if not bugnos:
+            return []
+        results = pool.map(lambda b: self.check_bug(b, series), sorted(bugnos))
+        return sum(results, [])
+
+    def sanity_check(self, package, version, series, diff_path, pool):
+        # Prints a report on the diff, returns it along with the problems.
+        with open(diff_path) as f:
+            report = analyze_diff(f)
+        problems = report.problems()
+        problems.extend(self.check_source_format(package, version, series))
+        problems.extend(self.check_bugs(report.bugs, series, pool))
+
+        print colored("%s %s: " % (package, version), 'white', attrs=['bold']) + report.summary()
+        for problem in problems:
+            print "\t" + colored(problem, 'red')
+        return (report, problems)
 
 def parse():
     parser = argparse.ArgumentParser(description='Kernel SRU Review Tool')
     parser.add_argument('--yes','-y', action='store_true')
-    parser.add_argument('--verbose','-v', action='store_true')
+    parser.add_argument('--verbose','-v', action='store_true',
+                        help='same as --profile')
+    parser.add_argument('--profile', action='store_true',
+                        help='print Launchpad, subprocess and download timings at exit')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='also write a Chrome trace (chrome://tracing) to FILE')
     parser.add_argument('--manual','-m', action='store_true')
+    parser.add_argument('--jobs','-j', type=int, default=4,
+                        help='number of tracking bugs fetched concurrently')
+    parser.add_argument('--no-cache', action='store_true',
+                        help="don't keep lookups in ~/.cache/spork between runs")
+    parser.add_argument('--warm', action='store_true',
+                        help='prepare diffs of proposed bugs in the background, '
+                             'while review prompts or after list exits')
+    parser.add_argument('--archive-fixture', metavar='FILE',
+                        help='read archive status from saved rmadison output')
     subparsers = parser.add_subparsers(dest='command')
     review_parser = subparsers.add_parser('review')
     list_parser = subparsers.add_parser('list')
@@ -398,11 +1147,18 @@ def parse():
     finish_parser.add_argument("pocket", default="proposed")
     status_parser = subparsers.add_parser('status')
     status_parser.add_argument("pocket", default="proposed")
+    watch_parser = subparsers.add_parser('watch')
+    watch_parser.add_argument('--interval', type=int, default=120,
+                              help='seconds between polls')
+    watch_parser.add_argument('--once', action='store_true',
+                              help='poll once and exit')
     args = parser.parse_args()
     return args
 
 if __name__ == "__main__":
     args = parse()
+    if args.verbose or args.profile or args.trace:
+        instrument.enable(args.trace)
     if args.command == "review":
         r = ReviewSRUKernel(args)
         r.list_sru_workflow(review=True)
@@ -421,3 +1177,6 @@ if __name__ == "__main__":
     elif args.command == "list":
         r = ReviewSRUKernel(args)
         r.list_sru_workflow()
+    elif args.command == "watch":
+        r = ReviewSRUKernel(args)
+        r.watch(args.interval, args.once)
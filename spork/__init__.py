@@ -0,0 +1,5 @@
+#
+# spork - shared helpers for the spork kernel tools
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
@@ -0,0 +1,44 @@
+#
+# archive - archive publishing status from a single rmadison query
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+
+import subprocess
+
+class ArchiveRecord:
+    def __init__(self, line):
+        fields = [ f.strip() for f in line.split('|') ]
+        (self.package, self.version, self.suite, self.arch) = fields[:4]
+        self.line = line
+
+class ArchiveStatus:
+    # Every package is looked up in one rmadison call and the output is kept
+    # as a table to filter on. A fixture file with rmadison output can be
+    # given instead, for working offline.
+
+    def __init__(self, packages, fixture=None):
+        self.packages = sorted(set(packages))
+        self.fixture = fixture
+        self.records = None
+
+    def load(self):
+        if self.fixture:
+            with open(self.fixture) as f:
+                output = f.read()
+        else:
+            cmd = [ "rmadison", "-a", "source" ] + self.packages
+            output = subprocess.check_output(cmd)
+
+        self.records = []
+        for line in output.splitlines():
+            if line.count('|') >= 3:
+                self.records.append(ArchiveRecord(line))
+
+    def query(self, packages, suite):
+        if self.records is None:
+            self.load()
+        # Outside main rmadison adds the component, e.g.
+        # xenial-proposed/universe.
+        return [ r for r in self.records
+                 if r.package in packages and r.suite.split('/')[0] == suite ]
@@ -0,0 +1,42 @@
+#
+# buildlog - read launchpad build logs incrementally
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+
+import urllib2
+import zlib
+
+from spork.debstream import DecompressReader
+from spork.instrument import span
+
+# The lines we look for are near the top of the log, don't read the whole
+# thing if they're missing.
+SCAN_LIMIT = 4 * 1024 * 1024
+
+def find_log_line(url, marker, limit=SCAN_LIMIT):
+    # Returns the first line of the gzipped log at url containing marker,
+    # or None. The connection is dropped as soon as the line is found.
+    with span('download', url):
+        response = urllib2.urlopen(url)
+        try:
+            log = DecompressReader(response,
+                                   zlib.decompressobj(16 + zlib.MAX_WBITS))
+            buf = ''
+            scanned = 0
+            while scanned < limit:
+                chunk = log.read(64 * 1024)
+                if not chunk:
+                    break
+                scanned += len(chunk)
+                buf += chunk
+                lines = buf.split('\n')
+                buf = lines.pop()
+                for line in lines:
+                    if marker in line:
+                        return line
+            if marker in buf:
+                return buf
+            return None
+        finally:
+            response.close()
@@ -0,0 +1,89 @@
+#
+# cache - small persistent key/value cache under ~/.cache/spork
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Entries without a status (or with an unknown one) use this TTL.
+DEFAULT_TTL = 60 * 60
+
+def cache_dir(*parts):
+    base = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    path = os.path.join(base, 'spork', *parts)
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # Someone else may have created it in the meantime.
+            if not os.path.isdir(path):
+                raise
+    return path
+
+class PersistentCache:
+    # ttls maps a status string to a lifetime in seconds, None meaning the
+    # entry never expires. max_entries caps the table, evicting the least
+    # recently used entries first.
+
+    def __init__(self, name, ttls=None, max_entries=10000, path=None):
+        self.path = path or os.path.join(cache_dir(), name + '.sqlite')
+        self.ttls = ttls or {}
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=30,
+                                  check_same_thread=False)
+        with self.lock:
+            self.db.execute("CREATE TABLE IF NOT EXISTS cache ("
+                            "key TEXT PRIMARY KEY, value TEXT, status TEXT, "
+                            "created REAL, accessed REAL)")
+            self.db.commit()
+
+    def ttl(self, status):
+        return self.ttls.get(status, DEFAULT_TTL)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT value, status, created FROM cache "
+                                  "WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            (value, status, created) = row
+            ttl = self.ttl(status)
+            if ttl is not None and now - created > ttl:
+                self.db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.db.commit()
+                return None
+            self.db.execute("UPDATE cache SET accessed = ? WHERE key = ?",
+                            (now, key))
+            self.db.commit()
+        return json.loads(value)
+
+    def put(self, key, value, status=None):
+        now = time.time()
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO cache "
+                            "(key, value, status, created, accessed) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (key, json.dumps(value), status, now, now))
+            self.evict()
+            self.db.commit()
+
+    def delete(self, key):
+        with self.lock:
+            self.db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.db.commit()
+
+    def evict(self):
+        # Caller holds the lock.
+        (count,) = self.db.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count <= self.max_entries:
+            return
+        self.db.execute("DELETE FROM cache WHERE key IN (SELECT key FROM "
+                        "cache ORDER BY accessed ASC LIMIT ?)",
+                        (count - self.max_entries,))
@@ -0,0 +1,223 @@
+#
+# debstream - scan .deb members straight off a stream, without temp files
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+
+import bz2
+import contextlib
+import os
+import subprocess
+import tarfile
+import threading
+import urllib2
+import zlib
+
+from spork.instrument import span
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+AR_MAGIC = '!<arch>\n'
+AR_HEADER_SIZE = 60
+CHUNK_SIZE = 64 * 1024
+
+class DebStreamError(Exception):
+    pass
+
+def read_exact(f, size):
+    data = ''
+    while len(data) < size:
+        chunk = f.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+class LimitedReader:
+    # Exposes the next size bytes of f as a file, so an ar member can be
+    # handed to tarfile without reading past its end.
+
+    def __init__(self, f, size):
+        self.f = f
+        self.remaining = size
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        if not size:
+            return ''
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def skip(self):
+        while self.remaining:
+            if not self.read(CHUNK_SIZE):
+                raise DebStreamError("Truncated ar member")
+
+class DecompressReader:
+    # Decompresses f incrementally, only as far as the reader asks for.
+
+    def __init__(self, f, decompressor):
+        self.f = f
+        self.decompressor = decompressor
+        self.buf = ''
+        self.eof = False
+
+    def read(self, size=-1):
+        while not self.eof and (size < 0 or len(self.buf) < size):
+            chunk = self.f.read(CHUNK_SIZE)
+            if not chunk:
+                self.eof = True
+                break
+            self.buf += self.decompressor.decompress(chunk)
+        if size < 0:
+            size = len(self.buf)
+        (data, self.buf) = (self.buf[:size], self.buf[size:])
+        return data
+
+    def close(self):
+        pass
+
+class CommandReader:
+    # Decompresses f through a command reading stdin and writing stdout,
+    # e.g. xz -dc. A thread feeds it f while the reader reads its output.
+
+    def __init__(self, f, argv):
+        try:
+            self.process = subprocess.Popen(argv, stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE,
+                                            stderr=open(os.devnull, 'w'))
+        except OSError as e:
+            raise DebStreamError("Couldn't run %s: %s" % (argv[0], e))
+        self.feeder = threading.Thread(target=self.feed, args=(f,))
+        self.feeder.daemon = True
+        self.feeder.start()
+
+    def feed(self, f):
+        try:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.process.stdin.write(chunk)
+        except (IOError, OSError, ValueError):
+            # close() killed the command before it had read everything.
+            pass
+        finally:
+            try:
+                self.process.stdin.close()
+            except (IOError, OSError):
+                pass
+
+    def read(self, size=-1):
+        return self.process.stdout.read(size)
+
+    def close(self):
+        # Stops the command, and with it the feeder, so nothing reads f
+        # once this returns.
+        if self.process.poll() is None:
+            self.process.kill()
+        self.feeder.join()
+        self.process.stdout.close()
+        self.process.wait()
+
+class IdentityDecompressor:
+    def decompress(self, data):
+        return data
+
+def decompressor_for(name):
+    if name.endswith('.gz'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif name.endswith('.bz2'):
+        return bz2.BZ2Decompressor()
+    elif name.endswith('.xz') or name.endswith('.lzma'):
+        if not lzma:
+            raise DebStreamError("No lzma module to read %s" % name)
+        return lzma.LZMADecompressor()
+    elif name.endswith('.tar'):
+        return IdentityDecompressor()
+    raise DebStreamError("Unsupported compression: %s" % name)
+
+def open_data_tar(name, member):
+    # Python 2 has no lzma module, so xz members go through xz -dc, as
+    # they do with dpkg.
+    if (name.endswith('.xz') or name.endswith('.lzma')) and not lzma:
+        return CommandReader(member, [ 'xz', '-dc' ])
+    return DecompressReader(member, decompressor_for(name))
+
+def iter_ar_members(f):
+    if read_exact(f, len(AR_MAGIC)) != AR_MAGIC:
+        raise DebStreamError("Not an ar archive")
+
+    while True:
+        header = read_exact(f, AR_HEADER_SIZE)
+        if not header:
+            return
+        if len(header) != AR_HEADER_SIZE or header[58:60] != '`\n':
+            raise DebStreamError("Bad ar member header")
+
+        name = header[0:16].rstrip().rstrip('/')
+        size = int(header[48:58])
+        member = LimitedReader(f, size)
+        yield (name, member)
+
+        # Skip whatever the consumer didn't read, plus the padding byte.
+        member.skip()
+        if size % 2:
+            read_exact(f, 1)
+
+def strip_dot(name):
+    return name[2:] if name.startswith('./') else name
+
+@contextlib.contextmanager
+def find_data_member(f, member_name):
+    # Yields a file object for member_name in the data.tar of the deb read
+    # from f, or None. Decompression stops at the member, and is cleaned
+    # up on leaving the with block.
+    member_name = strip_dot(member_name)
+    for (name, member) in iter_ar_members(f):
+        if not name.startswith('data.tar'):
+            continue
+        stream = open_data_tar(name, member)
+        try:
+            tar = tarfile.open(fileobj=stream, mode='r|')
+            found = None
+            for info in tar:
+                if strip_dot(info.name) == member_name and info.isfile():
+                    found = tar.extractfile(info)
+                    break
+            yield found
+        finally:
+            stream.close()
+        return
+    yield None
+
+def scan_stream(f, pattern, overlap=1024):
+    # Returns the first group of the first match of pattern in f. A tail of
+    # each chunk is carried over so matches spanning chunks are found.
+    buf = ''
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            return None
+        buf = buf[-overlap:] + chunk
+        match = pattern.search(buf)
+        if match:
+            return match.group(1)
+
+def scan_deb_member(url, member_name, pattern):
+    # Streams the deb at url and stops downloading as soon as pattern
+    # matches inside member_name.
+    with span('download', url):
+        response = urllib2.urlopen(url)
+        try:
+            with find_data_member(response, member_name) as member:
+                if not member:
+                    return None
+                return scan_stream(member, pattern)
+        finally:
+            response.close()
@@ -0,0 +1,261 @@
+#
+# diff - streaming unified diff filtering and an on-disk diff cache
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+
+import fnmatch
+import os
+import re
+import tempfile
+
+from spork.cache import cache_dir
+
+HUNK_RE = re.compile(r'^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@')
+BINARY_RE = re.compile(r'^Binary files (.*) and (.*) differ')
+# A bug list, as in (LP: #12345, #678), and the bugs in one.
+BUGS_RE = re.compile(r'LP: ?(#\d+(?:[,\s]+#\d+)*)')
+BUG_RE = re.compile(r'#(\d+)')
+
+# Limits for sanity checking a review diff.
+MAX_DIFF_SIZE = 7 * 1024 * 1024
+MAX_REMOVED_FILES = 20
+SUSPICIOUS_FILES = [ '*.swp', '*.swo', '.*.sw?', '*~' ]
+
+def iter_lines(f, chunk_size=64 * 1024):
+    # Lines of f, for readers that only implement read().
+    buf = ''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        buf += chunk
+        lines = buf.split('\n')
+        buf = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if buf:
+        yield buf
+
+def strip_path(name):
+    # '--- a/foo/bar\t2016-01-01' -> 'a/foo/bar'
+    return name.split('\t')[0].strip()
+
+def iter_diff_lines(lines):
+    # Classifies each line of a unified diff as 'file' (first line of a new
+    # file), 'header', 'hunk' or 'text'. Hunk line counts are tracked, so
+    # removed lines that look like '--- ' aren't mistaken for headers.
+    old = new = 0
+    in_header = False
+    for line in lines:
+        if old > 0 or new > 0:
+            if line.startswith('-'):
+                old -= 1
+            elif line.startswith('+'):
+                new -= 1
+            elif line.startswith(' ') or line in ('\n', '\r\n'):
+                old -= 1
+                new -= 1
+            yield ('hunk', line)
+            continue
+
+        match = HUNK_RE.match(line)
+        if match:
+            old = int(match.group(1) or 1)
+            new = int(match.group(2) or 1)
+            in_header = False
+            yield ('hunk', line)
+        elif line.startswith('diff '):
+            in_header = True
+            yield ('file', line)
+        elif line.startswith('--- '):
+            yield ('header' if in_header else 'file', line)
+            in_header = True
+        elif line.startswith('Binary files '):
+            yield ('header' if in_header else 'file', line)
+            in_header = False
+        elif in_header or line.startswith('+++ '):
+            yield ('header', line)
+        else:
+            yield ('text', line)
+
+def line_paths(line):
+    # File names mentioned by a 'file' or 'header' line.
+    if line.startswith('diff '):
+        return line.split()[-2:]
+    elif line.startswith('--- ') or line.startswith('+++ '):
+        return [ strip_path(line[4:]) ]
+    match = BINARY_RE.match(line)
+    if match:
+        return list(match.groups())
+    return []
+
+def iter_file_diffs(lines):
+    # Groups a unified diff into (paths, lines) per file. Text before the
+    # first file comes out with paths == [].
+    paths = []
+    section = []
+    for (kind, line) in iter_diff_lines(lines):
+        if kind == 'file' and section:
+            yield (paths, section)
+            (paths, section) = ([], [])
+        if kind in ('file', 'header'):
+            paths.extend(line_paths(line))
+        section.append(line)
+
+    if section:
+        yield (paths, section)
+
+def filter_diff(lines, excludes):
+    # Like 'filterdiff -x PATTERN': drops the files matching any pattern.
+    for (paths, section) in iter_file_diffs(lines):
+        if any(fnmatch.fnmatch(path, pattern)
+               for path in paths for pattern in excludes):
+            continue
+        for line in section:
+            yield line
+
+class DiffCache:
+    # Filtered diffs on disk, keyed by (package, old_version, new_version).
+
+    def __init__(self, root=None):
+        self.root = root or cache_dir('diffs')
+
+    def path(self, kind, package, old_version, new_version):
+        name = "%s_%s_%s.%s.diff" % (package, old_version, new_version, kind)
+        return os.path.join(self.root, name.replace('/', '_'))
+
+    def lookup(self, kind, package, old_version, new_version):
+        path = self.path(kind, package, old_version, new_version)
+        if os.path.exists(path):
+            return path
+        return None
+
+    def store(self, kind, package, old_version, new_version, lines):
+        # Written to a temporary file first, so readers never see a partial
+        # diff.
+        path = self.path(kind, package, old_version, new_version)
+        (fd, tmp) = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                for line in lines:
+                    f.write(line)
+            os.rename(tmp, path)
+        except:
+            os.unlink(tmp)
+            raise
+        return path
+
+class FileStat:
+    def __init__(self, start=0):
+        # Byte offsets of the file's section and of its hunks in the diff.
+        self.start = start
+        self.end = start
+        self.hunks = []
+        self.paths = []
+        self.added = 0
+        self.removed = 0
+        self.binary = False
+        self.created = False
+        self.deleted = False
+
+    @property
+    def name(self):
+        # The new name, without the leading 'linux-x.y.z/' directory.
+        names = [ p for p in self.paths if p != '/dev/null' ]
+        if not names:
+            return '?'
+        name = names[0] if self.deleted else names[-1]
+        return name.split('/', 1)[-1]
+
+class DiffReport:
+    # Per file diffstat and totals of a diff, plus whatever looks wrong.
+
+    def __init__(self):
+        self.files = []
+        self.size = 0
+        # Bugs referenced by the new changelog entries.
+        self.bugs = set()
+
+    @property
+    def added(self):
+        return sum([ f.added for f in self.files ])
+
+    @property
+    def removed(self):
+        return sum([ f.removed for f in self.files ])
+
+    @property
+    def deleted_files(self):
+        return [ f for f in self.files if f.deleted ]
+
+    @property
+    def binary_files(self):
+        return [ f for f in self.files if f.binary ]
+
+    @property
+    def suspicious_files(self):
+        return [ f for f in self.files
+                 if any(fnmatch.fnmatch(os.path.basename(f.name), pattern)
+                        for pattern in SUSPICIOUS_FILES) ]
+
+    def problems(self):
+        problems = []
+        if self.size >= MAX_DIFF_SIZE:
+            problems.append("diff is %.1fMB (limit %dMB)" %
+                            (self.size / 1048576.0, MAX_DIFF_SIZE / 1048576))
+        for f in self.binary_files:
+            problems.append("binary file: %s" % f.name)
+        for f in self.suspicious_files:
+            problems.append("swap/backup file: %s" % f.name)
+        if len(self.deleted_files) > MAX_REMOVED_FILES:
+            problems.append("%d files removed (limit %d)" %
+                            (len(self.deleted_files), MAX_REMOVED_FILES))
+        return problems
+
+    def summary(self):
+        return "%d files changed, %d insertions(+), %d deletions(-), " \
+               "%d removed, %.1fMB" % (len(self.files), self.added,
+               self.removed, len(self.deleted_files), self.size / 1048576.0)
+
+def analyze_diff(lines):
+    # One pass over the diff; only per file counters and offsets are kept
+    # in memory.
+    report = DiffReport()
+    current = None
+    for (kind, line) in iter_diff_lines(lines):
+        offset = report.size
+        report.size += len(line)
+        if kind == 'file':
+            current = FileStat(offset)
+            report.files.append(current)
+        if not current:
+            continue
+        current.end = report.size
+
+        if kind in ('file', 'header'):
+            current.paths.extend(line_paths(line))
+            if line.startswith('+++ /dev/null') or \
+               line.startswith('deleted file mode'):
+                current.deleted = True
+            elif line.startswith('--- /dev/null') or \
+                 line.startswith('new file mode'):
+                current.created = True
+            elif BINARY_RE.match(line) or line.startswith('GIT binary patch'):
+                current.binary = True
+        elif kind == 'hunk':
+            if line.startswith('@@'):
+                current.hunks.append(offset)
+                # diff -N marks removed files with an empty new range.
+                if ' +0,0 @@' in line:
+                    current.deleted = True
+                elif line.startswith('@@ -0,0 '):
+                    current.created = True
+            elif line.startswith('+'):
+                current.added += 1
+                if current.name.endswith('changelog'):
+                    for bugs in BUGS_RE.findall(line):
+                        report.bugs.update([ int(b) for b in BUG_RE.findall(bugs) ])
+            elif line.startswith('-'):
+                current.removed += 1
+    return report
@@ -0,0 +1,310 @@
+#
+# fetch - parallel, resumable downloads into a content-addressed store
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+
+import contextlib
+import fcntl
+import glob
+import hashlib
+import os
+import shutil
+import threading
+import urllib2
+import urlparse
+from multiprocessing.pool import ThreadPool
+
+from spork.cache import PersistentCache, cache_dir
+from spork.instrument import span
+
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 60
+
+# Files at least this big are fetched over several ranged connections.
+SEGMENT_THRESHOLD = 64 * 1024 * 1024
+CONNECTIONS = 4
+
+# Total size the store may grow to before old objects are evicted.
+STORE_BUDGET = 20 * 1024 * 1024 * 1024
+
+# url -> sha256, so files without known checksums are deduplicated too.
+URL_TTLS = { 'stored': None }
+URL_CACHE_SIZE = 50000
+
+# Partial file -> lock, so threads never download one url into the same
+# partial file at once. Other processes are kept out with flock().
+partial_locks = {}
+partial_locks_lock = threading.Lock()
+
+class FetchError(Exception):
+    pass
+
+@contextlib.contextmanager
+def lock_partial(path):
+    with partial_locks_lock:
+        lock = partial_locks.setdefault(path, threading.Lock())
+    with lock:
+        with open(path + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def remove_partial(path):
+    # The partial file and the segments of a ranged download.
+    for p in [ path ] + glob.glob(path + '.[0-9]*'):
+        if os.path.exists(p):
+            os.unlink(p)
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+def parse_dsc_files(path):
+    # Returns [(name, sha256, size)] from the Checksums-Sha256 field.
+    files = []
+    in_field = False
+    with open(path) as f:
+        for line in f:
+            if line.startswith('Checksums-Sha256:'):
+                in_field = True
+            elif in_field and line.startswith(' '):
+                (digest, size, name) = line.split()
+                files.append((name, digest, int(size)))
+            elif in_field:
+                break
+    return files
+
+def open_url(url, start=None, end=None):
+    request = urllib2.Request(url, headers={ 'User-Agent': 'spork' })
+    if start is not None:
+        request.add_header('Range', 'bytes=%d-%s' %
+                           (start, '' if end is None else end))
+    return urllib2.urlopen(request, timeout=TIMEOUT)
+
+def copy_response(response, path, mode='wb'):
+    try:
+        with open(path, mode) as f:
+            shutil.copyfileobj(response, f, CHUNK_SIZE)
+    finally:
+        response.close()
+
+def download_range(url, path, start, end):
+    # Fills path with bytes start..end of url, appending to what's already
+    # there from an earlier, interrupted run.
+    have = os.path.getsize(path) if os.path.exists(path) else 0
+    if have >= end - start + 1:
+        return
+    response = open_url(url, start + have, end)
+    if response.getcode() != 206:
+        response.close()
+        raise FetchError("Server ignored range request for %s" % url)
+    copy_response(response, path, 'ab')
+
+class ContentStore:
+    # Objects live under objects/<sha256[:2]>/<sha256>. Their mtime is
+    # bumped on every use, so eviction can drop the least recently used.
+
+    def __init__(self, root=None, budget=STORE_BUDGET):
+        self.root = root or cache_dir('store')
+        self.budget = budget
+        self.partial_dir = os.path.join(self.root, 'partial')
+        self.links_path = os.path.join(self.root, 'links')
+        self.lock = threading.Lock()
+        for d in (self.partial_dir, os.path.join(self.root, 'objects')):
+            if not os.path.isdir(d):
+                os.makedirs(d)
+
+    def path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def lookup(self, digest):
+        path = self.path(digest)
+        if not os.path.exists(path):
+            return None
+        os.utime(path, None)
+        return path
+
+    def add(self, src, digest):
+        path = self.path(digest)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        os.rename(src, path)
+        self.evict(keep=path)
+        return path
+
+    def add_links(self, directory):
+        # Objects symlinked from directory aren't evicted while it exists.
+        directory = os.path.abspath(directory)
+        with self.lock:
+            if directory not in self.read_links():
+                with open(self.links_path, 'a') as f:
+                    f.write(directory + '\n')
+
+    def read_links(self):
+        if not os.path.exists(self.links_path):
+            return []
+        with open(self.links_path) as f:
+            return [ l.rstrip('\n') for l in f if l.strip() ]
+
+    def linked_objects(self):
+        # Caller holds the lock. Forgets directories that are gone.
+        directories = [ d for d in self.read_links() if os.path.isdir(d) ]
+        with open(self.links_path + '.new', 'w') as f:
+            f.write(''.join([ d + '\n' for d in directories ]))
+        os.rename(self.links_path + '.new', self.links_path)
+
+        linked = set()
+        for d in directories:
+            for name in os.listdir(d):
+                path = os.path.join(d, name)
+                if os.path.islink(path):
+                    linked.add(os.path.realpath(path))
+        return linked
+
+    def evict(self, keep=None):
+        with self.lock:
+            linked = self.linked_objects()
+            objects = []
+            total = 0
+            top = os.path.join(self.root, 'objects')
+            for d in os.listdir(top):
+                for name in os.listdir(os.path.join(top, d)):
+                    path = os.path.join(top, d, name)
+                    st = os.stat(path)
+                    objects.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+            objects.sort()
+            for (mtime, size, path) in objects:
+                if total <= self.budget:
+                    break
+                if path == keep or os.path.realpath(path) in linked:
+                    continue
+                os.unlink(path)
+                total -= size
+
+class Fetcher:
+
+    def __init__(self, store=None, connections=CONNECTIONS, url_cache=None):
+        self.store = store or ContentStore()
+        self.connections = connections
+        self.url_cache = url_cache or PersistentCache('fetched', URL_TTLS,
+                                                      URL_CACHE_SIZE)
+
+    def fetch(self, url, sha256=None):
+        # Returns the store path of url, downloading it only if no object
+        # with its checksum (given, or remembered from last time) exists.
+        digest = sha256 or (self.url_cache.get(url) or {}).get('sha256')
+        if digest:
+            path = self.store.lookup(digest)
+            if path:
+                return path
+
+        partial = os.path.join(self.store.partial_dir,
+                               hashlib.sha1(url).hexdigest())
+        with lock_partial(partial):
+            # Whoever held the lock may have just stored it.
+            digest = sha256 or (self.url_cache.get(url) or {}).get('sha256')
+            if digest:
+                path = self.store.lookup(digest)
+                if path:
+                    return path
+
+            # A partial file that fails the size or checksum check can't be
+            # resumed, so it goes.
+            try:
+                with span('download', url) as info:
+                    self.download(url, partial)
+                    info['bytes'] = os.path.getsize(partial)
+
+                digest = sha256_file(partial)
+                if sha256 and digest != sha256:
+                    raise FetchError("Checksum mismatch for %s" % url)
+            except FetchError:
+                remove_partial(partial)
+                raise
+            self.url_cache.put(url, { 'sha256': digest }, 'stored')
+            return self.store.add(partial, digest)
+
+    def download(self, url, path):
+        response = open_url(url)
+        size = int(response.info().getheader('Content-Length') or 0)
+        ranges = response.info().getheader('Accept-Ranges') == 'bytes'
+        url = response.geturl()
+
+        # Left over from a different version of the file.
+        if size and os.path.exists(path) and os.path.getsize(path) > size:
+            os.unlink(path)
+
+        if ranges and size >= SEGMENT_THRESHOLD and self.connections > 1:
+            response.close()
+            self.download_segments(url, path, size)
+        elif ranges and size and os.path.exists(path):
+            response.close()
+            download_range(url, path, 0, size - 1)
+        else:
+            copy_response(response, path)
+
+        if size and os.path.getsize(path) != size:
+            raise FetchError("Short download of %s" % url)
+
+    def download_segments(self, url, path, size):
+        # Each segment goes to its own file, so an interrupted download
+        # resumes every segment where it stopped.
+        step = (size + self.connections - 1) // self.connections
+        segments = [ ("%s.%d" % (path, i), start,
+                      min(start + step, size) - 1)
+                     for (i, start) in enumerate(range(0, size, step)) ]
+
+        pool = ThreadPool(len(segments))
+        try:
+            pool.map(lambda s: download_range(url, *s), segments)
+        finally:
+            pool.terminate()
+
+        with open(path, 'wb') as f:
+            for (segment, start, end) in segments:
+                with open(segment, 'rb') as s:
+                    shutil.copyfileobj(s, f, CHUNK_SIZE)
+        for (segment, start, end) in segments:
+            os.unlink(segment)
+
+    def fetch_all(self, items):
+        # items are urls or (url, sha256) tuples; returns paths in order.
+        items = [ (i, None) if isinstance(i, basestring) else i
+                  for i in items ]
+        if len(items) < 2:
+            return [ self.fetch(*i) for i in items ]
+        pool = ThreadPool(min(self.connections, len(items)))
+        try:
+            return pool.map(lambda i: self.fetch(*i), items)
+        finally:
+            pool.terminate()
+
+    def fetch_source(self, dsc_url, dest):
+        # Like 'dget -u': places the .dsc and the files it lists in dest,
+        # as symlinks into the store. Returns the local .dsc path.
+        if not os.path.isdir(dest):
+            os.makedirs(dest)
+        self.store.add_links(dest)
+        dsc = self.fetch(dsc_url)
+        files = parse_dsc_files(dsc)
+        paths = self.fetch_all([ (urlparse.urljoin(dsc_url, name), digest)
+                                 for (name, digest, size) in files ])
+
+        links = [ (dsc_url.split('/')[-1], dsc) ]
+        links += zip([ name for (name, digest, size) in files ], paths)
+        for (name, path) in links:
+            link = os.path.join(dest, name)
+            if os.path.lexists(link):
+                os.unlink(link)
+            os.symlink(path, link)
+        return os.path.join(dest, links[0][0])
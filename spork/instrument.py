@@ -0,0 +1,197 @@
+#
+# instrument - count and time Launchpad requests and subprocesses
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+
+import atexit
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Frames from these files are never reported as the call site; we want the
+# line in our own code that caused the request.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SKIP_FILES = (os.path.abspath(__file__).rstrip('c'),)
+
+class Stat:
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self.total = 0.0
+        self.slowest = 0.0
+
+    def add(self, duration, size):
+        self.calls += 1
+        self.bytes += size
+        self.total += duration
+        self.slowest = max(self.slowest, duration)
+
+def call_site():
+    f = sys._getframe(2)
+    while f:
+        path = os.path.abspath(f.f_code.co_filename)
+        if (path.startswith(ROOT) and 'site-packages' not in path and
+                path.rstrip('c') not in SKIP_FILES):
+            return "%s:%d %s" % (os.path.relpath(path, ROOT), f.f_lineno,
+                                 f.f_code.co_name)
+        f = f.f_back
+    return "?"
+
+class Profiler:
+    # Aggregates (category, call site) stats and, when tracing, keeps every
+    # event for a Chrome trace (chrome://tracing, "X" complete events).
+
+    def __init__(self, trace=None):
+        self.trace = trace
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.events = []
+        self.started = time.time()
+
+    def record(self, category, name, site, start, duration, size=0):
+        with self.lock:
+            key = (category, site)
+            if key not in self.stats:
+                self.stats[key] = Stat()
+            self.stats[key].add(duration, size)
+            if self.trace:
+                self.events.append({
+                    'name': name, 'cat': category, 'ph': 'X',
+                    'ts': int((start - self.started) * 1e6),
+                    'dur': int(duration * 1e6),
+                    'pid': os.getpid(),
+                    'tid': threading.current_thread().ident,
+                    'args': {'site': site, 'bytes': size},
+                })
+
+    @contextmanager
+    def span(self, category, name):
+        # Times the block; it can set info['bytes'] to report a size.
+        site = call_site()
+        start = time.time()
+        info = {}
+        try:
+            yield info
+        finally:
+            self.record(category, name, site, start, time.time() - start,
+                        info.get('bytes', 0))
+
+    def summary(self, out=sys.stderr, limit=25):
+        with self.lock:
+            stats = sorted(self.stats.items(), key=lambda i: -i[1].total)
+        out.write("\n%-10s %-50s %6s %9s %9s %10s\n" %
+                  ("category", "call site", "calls", "total", "slowest",
+                   "bytes"))
+        for ((category, site), s) in stats[:limit]:
+            out.write("%-10s %-50s %6d %8.2fs %8.2fs %10d\n" %
+                      (category, site[-50:], s.calls, s.total, s.slowest,
+                       s.bytes))
+        if len(stats) > limit:
+            out.write("... %d more call sites\n" % (len(stats) - limit))
+        out.write("wall time %.2fs\n" % (time.time() - self.started))
+
+    def write_trace(self):
+        with self.lock:
+            events = list(self.events)
+        with open(self.trace, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def finish(self):
+        self.summary()
+        if self.trace:
+            self.write_trace()
+
+profiler = None
+
+def span(category, name):
+    # No-op unless instrumentation is enabled, so callers can always use it.
+    if profiler:
+        return profiler.span(category, name)
+    return _nothing()
+
+@contextmanager
+def _nothing():
+    yield {}
+
+def instrument_launchpad(p):
+    # Every Launchpad entry, collection page and named operation goes
+    # through Browser._request, so that is the one place to hook.
+    try:
+        from lazr.restfulclient._browser import Browser
+    except ImportError:
+        return
+    request = Browser._request
+
+    def _request(self, url, data=None, method='GET', *args, **kwargs):
+        site = call_site()
+        start = time.time()
+        size = len(data or '')
+        try:
+            response, content = request(self, url, data, method,
+                                         *args, **kwargs)
+            size += len(content or '')
+            return response, content
+        finally:
+            name = "%s %s" % (method, url.split('?')[0])
+            p.record('launchpad', name, site, start, time.time() - start,
+                     size)
+    Browser._request = _request
+
+def instrument_subprocess(p):
+    # check_output(), call() and friends all construct subprocess.Popen,
+    # so replacing it covers every command we run.
+    Popen = subprocess.Popen
+
+    class ProfiledPopen(Popen):
+        def __init__(self, args, *a, **kw):
+            self._site = call_site()
+            self._start = time.time()
+            self._recorded = False
+            self._communicating = False
+            self._bytes = 0
+            cmd = args if isinstance(args, basestring) else ' '.join(args)
+            self._name = cmd[:80]
+            Popen.__init__(self, args, *a, **kw)
+
+        def communicate(self, *a, **kw):
+            # communicate() waits itself; record once we know the output.
+            self._communicating = True
+            out = Popen.communicate(self, *a, **kw)
+            self._communicating = False
+            self._bytes = sum(len(o or '') for o in out)
+            self._done()
+            return out
+
+        def wait(self):
+            returncode = Popen.wait(self)
+            self._done()
+            return returncode
+
+        def poll(self):
+            returncode = Popen.poll(self)
+            if returncode is not None:
+                self._done()
+            return returncode
+
+        def _done(self):
+            if self._recorded or self._communicating:
+                return
+            self._recorded = True
+            p.record('subprocess', self._name, self._site, self._start,
+                     time.time() - self._start, self._bytes)
+    subprocess.Popen = ProfiledPopen
+
+def enable(trace=None):
+    global profiler
+    if profiler:
+        return profiler
+    profiler = Profiler(trace)
+    instrument_launchpad(profiler)
+    instrument_subprocess(profiler)
+    atexit.register(profiler.finish)
+    return profiler
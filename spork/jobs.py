@@ -0,0 +1,139 @@
+#
+# jobs - run tracked subprocesses concurrently
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+print_lock = threading.Lock()
+
+def log(message, prefix=None):
+    # Whole lines only, so concurrent jobs don't interleave mid-line.
+    with print_lock:
+        if prefix:
+            message = "[%s] %s" % (prefix, message)
+        sys.stdout.write(message.rstrip('\n') + '\n')
+        sys.stdout.flush()
+
+class Job:
+    # A command plus what happened when it ran.
+
+    def __init__(self, cmd, label=None, cwd=None, key=None):
+        self.cmd = cmd
+        self.label = label or cmd[0]
+        self.cwd = cwd
+        # Lets callers tell which of their items a finished job belongs to.
+        self.key = key
+        self.returncode = None
+        self.error = None
+        self.start = None
+        self.duration = None
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    def run(self):
+        # Output is streamed line by line, prefixed with the job label.
+        self.start = time.time()
+        try:
+            p = subprocess.Popen(self.cmd, cwd=self.cwd,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT)
+            for line in iter(p.stdout.readline, ''):
+                log(line, self.label)
+            p.stdout.close()
+            self.returncode = p.wait()
+        except OSError as e:
+            self.error = str(e)
+            self.returncode = -1
+        self.duration = time.time() - self.start
+        return self
+
+def run_jobs(jobs, concurrency):
+    # Runs jobs with at most concurrency at a time, yielding each one as it
+    # finishes.
+    if not jobs:
+        return
+    pool = ThreadPool(max(1, min(concurrency, len(jobs))))
+    try:
+        for job in pool.imap_unordered(lambda j: j.run(), jobs):
+            yield job
+    finally:
+        pool.terminate()
+
+class Backoff:
+    def __init__(self, initial=5, factor=1.5, maximum=60):
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+        self.delay = initial
+
+    def next(self):
+        delay = self.delay
+        self.delay = min(self.delay * self.factor, self.maximum)
+        return delay
+
+    def reset(self):
+        self.delay = self.initial
+
+class StepFailed(Exception):
+    pass
+
+class BatchItem:
+    # One unit of batch work (e.g. a bug), timing each step it goes through.
+
+    def __init__(self, key, label=None, data=None):
+        self.key = key
+        self.label = label or str(key)
+        # Whatever the work function needs to know about the item.
+        self.data = data
+        self.steps = []
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def step(self, name, fn, *args, **kwargs):
+        start = time.time()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            self.error = "%s: %s" % (name, e)
+            raise StepFailed(self.error)
+        finally:
+            self.steps.append((name, time.time() - start))
+
+def run_batch(items, work, concurrency):
+    # Calls work(item) for every item, at most concurrency at a time. The
+    # first failing step stops that item only. Returns items in order.
+    def run(item):
+        try:
+            work(item)
+        except StepFailed:
+            pass
+        except Exception as e:
+            item.error = str(e)
+        return item
+
+    if not items:
+        return []
+    pool = ThreadPool(max(1, min(concurrency, len(items))))
+    try:
+        return pool.map(run, items)
+    finally:
+        pool.terminate()
+
+def format_summary(items):
+    lines = []
+    for item in items:
+        steps = '  '.join([ "%s %.1fs" % step for step in item.steps ])
+        status = "ok" if item.ok else "FAILED (%s)" % item.error
+        lines.append("%-12s %s  %s" % (item.label, steps, status))
+    return lines
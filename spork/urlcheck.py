@@ -0,0 +1,129 @@
+#
+# urlcheck - verify URLs with HEAD requests over kept-alive connections
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+
+import httplib
+import socket
+import threading
+import urlparse
+from multiprocessing.pool import ThreadPool
+
+from spork.instrument import span
+
+MAX_REDIRECTS = 5
+TIMEOUT = 30
+
+# Positive results are cached, a file in the librarian doesn't go away.
+URL_TTLS = { 'ok': 7 * 24 * 60 * 60 }
+URL_CACHE_SIZE = 20000
+
+class ConnectionPool:
+    # Idle connections per (scheme, host, port), reused between requests.
+
+    def __init__(self, timeout=TIMEOUT):
+        self.timeout = timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            conns = self.idle.get(key)
+            if conns:
+                return (conns.pop(), True)
+        (scheme, host, port) = key
+        if scheme == 'https':
+            conn = httplib.HTTPSConnection(host, port, timeout=self.timeout)
+        else:
+            conn = httplib.HTTPConnection(host, port, timeout=self.timeout)
+        return (conn, False)
+
+    def put(self, key, conn):
+        with self.lock:
+            self.idle.setdefault(key, []).append(conn)
+
+    def close(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle = {}
+
+class URLChecker:
+
+    def __init__(self, jobs=8, cache=None, refresh=False):
+        self.jobs = jobs
+        self.cache = cache
+        self.refresh = refresh
+        self.pool = ConnectionPool()
+
+    def head(self, url):
+        # Returns (status, response) for a single HEAD request, retrying once
+        # on a fresh connection if a pooled one turned out to be stale.
+        parts = urlparse.urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        with span('http', 'HEAD ' + url):
+            while True:
+                (conn, reused) = self.pool.get(key)
+                try:
+                    conn.request('HEAD', path, headers={ 'User-Agent': 'spork' })
+                    response = conn.getresponse()
+                    response.read()
+                except (httplib.HTTPException, socket.error):
+                    conn.close()
+                    if reused:
+                        continue
+                    raise
+                if response.will_close:
+                    conn.close()
+                else:
+                    self.pool.put(key, conn)
+                return response
+
+    def check(self, url):
+        # Returns a dict with the final status and Content-Length of url.
+        if self.cache and not self.refresh:
+            cached = self.cache.get(url)
+            if cached is not None:
+                return cached
+
+        result = { 'url': url, 'status': None, 'size': None }
+        target = url
+        try:
+            for i in range(MAX_REDIRECTS + 1):
+                response = self.head(target)
+                result['status'] = response.status
+                location = response.getheader('Location')
+                if response.status in (301, 302, 303, 307, 308) and location:
+                    target = urlparse.urljoin(target, location)
+                    continue
+                size = response.getheader('Content-Length')
+                result['size'] = int(size) if size else None
+                break
+        except (httplib.HTTPException, socket.error) as e:
+            result['error'] = str(e)
+            return result
+
+        if self.cache and self.ok(result):
+            self.cache.put(url, result, 'ok')
+        return result
+
+    def check_all(self, urls):
+        # Checks urls concurrently, results are in the same order as urls.
+        if len(urls) < 2:
+            return [ self.check(url) for url in urls ]
+        pool = ThreadPool(min(self.jobs, len(urls)))
+        try:
+            return pool.map(self.check, urls)
+        finally:
+            pool.terminate()
+
+    @staticmethod
+    def ok(result):
+        return result['status'] is not None and 200 <= result['status'] < 300
@@ -0,0 +1,98 @@
+#
+# viewer - page through single files of a large diff
+#
+# Copyright (C) 2015, 2016 Chris J Arges <chris.j.arges@canonical.com>
+#
+
+import mmap
+import subprocess
+
+PAGER = "view -c 'set syntax=diff' -"
+WRITE_SIZE = 1024 * 1024
+
+def parse_selection(text, count):
+    # '1,3-5' -> [0, 2, 3, 4]; 'a' selects everything.
+    if text.strip() in ('a', 'all'):
+        return range(count)
+    selected = []
+    for part in text.replace(' ', '').split(','):
+        if not part:
+            continue
+        if '-' in part:
+            (first, last) = part.split('-', 1)
+            numbers = range(int(first), int(last) + 1)
+        else:
+            numbers = [ int(part) ]
+        selected.extend([ n - 1 for n in numbers if 0 < n <= count ])
+    return selected
+
+class DiffViewer:
+    # Shows the file list of a diff first, then pipes only the files that
+    # get picked to the pager, reading them through an mmap of the diff.
+    # report is the spork.diff.DiffReport with the file offsets.
+
+    def __init__(self, path, report, pager=PAGER):
+        self.path = path
+        self.report = report
+        self.pager = pager
+
+    def list_files(self, pattern=None):
+        files = self.report.files
+        width = len(str(len(files)))
+        for (i, f) in enumerate(files):
+            if pattern and pattern not in f.name:
+                continue
+            flags = ''
+            if f.deleted:
+                flags = ' (removed)'
+            elif f.created:
+                flags = ' (new)'
+            elif f.binary:
+                flags = ' (binary)'
+            print("%*d %s | +%d -%d, %d hunks%s" % (width, i + 1, f.name,
+                  f.added, f.removed, len(f.hunks), flags))
+        print(self.report.summary())
+
+    def show(self, indexes):
+        if not indexes:
+            return
+        with open(self.path, 'rb') as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                p = subprocess.Popen(self.pager, shell=True,
+                                     stdin=subprocess.PIPE)
+                try:
+                    for i in indexes:
+                        stat = self.report.files[i]
+                        for start in range(stat.start, stat.end, WRITE_SIZE):
+                            p.stdin.write(m[start:min(start + WRITE_SIZE,
+                                                      stat.end)])
+                except IOError:
+                    # The pager was quit before reading everything.
+                    pass
+                finally:
+                    try:
+                        p.stdin.close()
+                    except IOError:
+                        pass
+                    p.wait()
+            finally:
+                m.close()
+
+    def run(self, prompt=raw_input):
+        count = len(self.report.files)
+        if not count:
+            return
+        self.list_files()
+        while True:
+            answer = prompt("View files (1,3-5 / a=all / /text=search / "
+                            "q=done): ").strip()
+            if answer in ('', 'q'):
+                return
+            if answer.startswith('/'):
+                self.list_files(answer[1:])
+                continue
+            try:
+                self.show(parse_selection(answer, count))
+            except ValueError:
+                print("Invalid selection: %s" % answer)